@@ -33,7 +33,7 @@ async def generate_detailed_report(
         Tuple[pdf_path, csv_path] или None при ошибке
     """
     # Загружаем из кэша
-    data = cache.load(cache_key)
+    data = await cache.aload(cache_key)
     if not data:
         logger.error(f"❌ Cache not found for key: {cache_key}")
         return None
@@ -137,10 +137,10 @@ def _generate_extended_csv(
                         master_category = master_names.get(master_id, f"Категория {master_id}")
                         master_category_id = master_id
                         # Считаем размер мастер-категории для сортировки
-                        master_category_size = sum(
-                            len(df[df['cluster_id'] == cid]) 
+                        master_category_size = int(sum(
+                            cluster_counts.get(cid, 0)
                             for cid in sub_clusters
-                        )
+                        ))
                         break
             
             stats_data.append({
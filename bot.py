@@ -5,14 +5,19 @@ from logging.handlers import RotatingFileHandler
 from pathlib import Path
 import os
 import asyncio
+import weakref
 from dotenv import load_dotenv
 import html
+import re
+from io import BytesIO
 import pandas as pd
 from metrics import ClusteringMetrics
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 from clustering import clusterize_texts
 from clustering import generate_insight_yandex
+from clustering import parquet_path_for
+from clustering import warmup_umap
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from cache_manager import cache
 from analytics import generate_detailed_report
@@ -26,6 +31,7 @@ from utils import (
     get_user_display_name
 )
 from config import ADMIN_TELEGRAM_ID
+from config import WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT
 import datetime
 from progress_tracker import ProgressTracker
 from evaluation import (
@@ -41,8 +47,21 @@ from prompt_manager import PromptManager
 prompt_manager = PromptManager()
 category_generator = None
 
+# Не больше двух кластеризаций одновременно (каждая — в своём потоке)
 PROCESSING_SEMAPHORE = asyncio.Semaphore(2)
 
+# Файлы одного пользователя обрабатываются по очереди: с concurrent_updates
+# второй файл иначе шёл бы параллельно с первым и делил бы с ним user_data.
+# Слабые ссылки: блокировка живёт, пока её держит или ждёт хоть один обработчик
+USER_FILE_LOCKS: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+# Мусорные строки для классификации: команды и имена файлов (без учёта регистра)
+JUNK_TEXT_PATTERN = re.compile(r'^/|\.(?:png|jpe?g|pdf|gif)$', re.IGNORECASE)
+
+# Подписи кнопок под результатом кластеризации
+PDF_BUTTON_LABEL = "Детальный отчёт в PDF"
+SHARE_BUTTON_LABEL = "Поделиться"
+
 # Состояния для ConversationHandler
 class BotStates:
     """Состояния бота"""
@@ -99,7 +118,9 @@ logger = logging.getLogger(__name__)
 classifier = None
 CLASSIFICATION_AVAILABLE = False
 try:
-    from classification import LLMClassifier, validate_categories, parse_categories_from_text
+    from classification import (
+        LLMClassifier, confidence_as_float64, validate_categories, parse_categories_from_text
+    )
     if os.getenv("YANDEX_API_KEY") and os.getenv("YANDEX_FOLDER_ID"):
         classifier = LLMClassifier()
         CLASSIFICATION_AVAILABLE = True
@@ -124,6 +145,15 @@ if classifier:
 load_dotenv()
 TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 
+async def read_document(path) -> BytesIO:
+    """
+    Читает файл для отправки в Telegram в отдельном потоке.
+    PTB всё равно читает файл целиком перед загрузкой, поэтому делаем это
+    вне event loop и не держим дескриптор открытым во время отправки.
+    """
+    return BytesIO(await asyncio.to_thread(Path(path).read_bytes))
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Стартовое сообщение с выбором режима"""
     user_id = update.effective_user.id
@@ -523,6 +553,8 @@ async def handle_mode_selection(update: Update, context: ContextTypes.DEFAULT_TY
             return
         
         context.user_data['mode'] = 'classification'
+        # Отмена перегенерации через "Изменить промт" → "Отмена" ведёт сюда
+        context.user_data.pop('regenerate_categories', None)
         
         # НОВОЕ: Выбор способа задания категорий
         text = """
@@ -750,9 +782,10 @@ async def start_category_generation(update: Update, context: ContextTypes.DEFAUL
     try:
         custom_prompt = context.user_data.get('custom_generation_prompt')
         
-        success, categories, error = category_generator.generate_categories(
+        success, categories, error = await category_generator.generate_categories(
             sample_texts,
-            custom_prompt=custom_prompt
+            custom_prompt=custom_prompt,
+            use_cache=not context.user_data.pop('regenerate_categories', False)
         )
         
         if not success:
@@ -810,6 +843,11 @@ async def handle_generated_categories_action(update: Update, context: ContextTyp
     
     logger.info(f"📋 GENERATED CATS ACTION | User: {user_id} | Action: {action}")
     
+    # Флаг перегенерации живёт только до следующего запуска генерации:
+    # любое другое действие с категориями его сбрасывает
+    if action != "regenerate_cats":
+        context.user_data.pop('regenerate_categories', None)
+    
     if action == "approve_generated_cats":
         # Утверждаем категории
         categories = context.user_data.get('generated_categories', [])
@@ -894,7 +932,8 @@ async def handle_generated_categories_action(update: Update, context: ContextTyp
         )
     
     elif action == "regenerate_cats":
-        # Перегенерировать
+        # Перегенерировать (в обход кэша категорий — нужен новый ответ модели)
+        context.user_data['regenerate_categories'] = True
         text = """
 🔄 <b>Перегенерация категорий</b>
 
@@ -1466,7 +1505,7 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"⚠️ <b>Предупреждений:</b> {warnings_count}\n\n"
             f"👥 <b>Активных пользователей:</b> {active_users}\n"
             f"💾 <b>Элементов в кэше:</b> {cache_items}\n\n"
-            f"⏰ <b>Время:</b> {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+            f"⏰ <b>Время:</b> {time.strftime('%Y-%m-%d %H:%M:%S')}"
         )
         
         await update.message.reply_text(msg, parse_mode='HTML')
@@ -1479,6 +1518,15 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    lock = USER_FILE_LOCKS.get(user_id)
+    if lock is None:
+        lock = USER_FILE_LOCKS[user_id] = asyncio.Lock()
+    async with lock:
+        await process_file(update, context)
+
+
+async def process_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     progress_msg = None
     file_path = None
     result_path = None
@@ -1615,6 +1663,8 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 # Получаем выборку
                 sample = category_generator.get_sample(texts)
                 context.user_data['sample_texts'] = sample
+                # Новая выборка — кэш категорий снова можно использовать
+                context.user_data.pop('regenerate_categories', None)
                 context.user_data['full_file_path'] = safe_file_path  # ⭐ Сохраняем безопасный путь
                 context.user_data['original_filename'] = update.message.document.file_name
 
@@ -1834,11 +1884,15 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
             elif "Сохранение" in msg or "сохран" in msg.lower() or "💾" in msg:
                 await tracker.update("💾 Сохранение результатов", 95)
         
-        # Вызываем кластеризацию с callback
-        result_path, stats, hierarchy, master_names = clusterize_texts(
-            file_path, 
-            progress_callback=clustering_progress_callback
-        )
+        # Вызываем кластеризацию с callback — в отдельном потоке, чтобы не
+        # блокировать цикл событий (апдейты других пользователей, прогресс)
+        async with PROCESSING_SEMAPHORE:
+            result_path, stats, hierarchy, master_names = await asyncio.to_thread(
+                clusterize_texts,
+                file_path, 
+                progress_callback=clustering_progress_callback,
+                event_loop=asyncio.get_running_loop()
+            )
         
         # Этап 5: Формирование результата
         await tracker.update(
@@ -1866,7 +1920,12 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
         stats_message += "\n\n✨ Готово! Хотите проанализировать другие тексты? Отправляйте новый файл — я готов!"
 
         # Сохраняем в кэш (перед отправкой файла)
-        df_cached = pd.read_csv(result_path, encoding='utf-8')
+        # Parquet-копия читается быстрее CSV; если её нет — читаем CSV
+        parquet_path = parquet_path_for(result_path)
+        if os.path.exists(parquet_path):
+            df_cached = pd.read_parquet(parquet_path)
+        else:
+            df_cached = pd.read_csv(result_path, encoding='utf-8')
         
         cache_data = {
             'df': df_cached,
@@ -1880,7 +1939,7 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
             'master_names': master_names
         }
         
-        cache_key = cache.save(
+        cache_key = await cache.asave(
             user_id=update.effective_user.id,
             file_name=update.message.document.file_name,
             data=cache_data
@@ -1896,10 +1955,10 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except Exception as e:
             logger.warning(f"Failed to delete progress message: {e}")
         
-        # Показываем кнопки выбора
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("Детальный отчёт в PDF", callback_data=f"pdf_{cache_key}")],
-            [InlineKeyboardButton("Поделиться", callback_data=f"share_{cache_key}")]
+        # Показываем кнопки выбора (меняется только callback_data)
+        keyboard = InlineKeyboardMarkup.from_column([
+            InlineKeyboardButton(PDF_BUTTON_LABEL, callback_data=f"pdf_{cache_key}"),
+            InlineKeyboardButton(SHARE_BUTTON_LABEL, callback_data=f"share_{cache_key}")
         ])
 
         MAX_CAPTION_LENGTH = 1000  # С запасом (лимит 1024)
@@ -1908,14 +1967,13 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # Короткий caption для файла
             short_caption = "✅ <b>Кластеризация завершена!</b>\n\n📎 Подробная статистика ниже"
             
-            with open(result_path, 'rb') as result_file:
-                await update.message.reply_document(
-                    document=result_file,
-                    filename=os.path.basename(result_path),
-                    caption=short_caption,
-                    parse_mode='HTML',
-                    reply_markup=keyboard
-                )
+            await update.message.reply_document(
+                document=await read_document(result_path),
+                filename=os.path.basename(result_path),
+                caption=short_caption,
+                parse_mode='HTML',
+                reply_markup=keyboard
+            )
             
             # Статистика отдельно
             await update.message.reply_text(
@@ -1924,14 +1982,13 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
         else:
             # Если короткая — всё в одном
-            with open(result_path, 'rb') as result_file:
-                await update.message.reply_document(
-                    document=result_file,
-                    filename=os.path.basename(result_path),
-                    caption=stats_message,
-                    parse_mode='HTML',
-                    reply_markup=keyboard
-                )
+            await update.message.reply_document(
+                document=await read_document(result_path),
+                filename=os.path.basename(result_path),
+                caption=stats_message,
+                parse_mode='HTML',
+                reply_markup=keyboard
+            )
         
         # Отправка статистики
         if 'quality_metrics' in stats:
@@ -1971,7 +2028,7 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         f"👤 <b>Пользователь:</b> {user_display} (ID: {user_id})\n"
                         f"📄 <b>Файл:</b> {html.escape(file_name) if file_name else 'N/A'}\n"
                         f"❌ <b>Ошибка:</b> {html.escape(str(e)[:300])}\n\n"
-                        f"⏰ <b>Время:</b> {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+                        f"⏰ <b>Время:</b> {time.strftime('%Y-%m-%d %H:%M:%S')}"
                     ),
                     parse_mode='HTML'
                 )
@@ -2000,6 +2057,8 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     finally:
         # Очистка временных файлов
         cleanup_file_safe(file_path)
+        if result_path:
+            cleanup_file_safe(parquet_path_for(result_path))
         if result_path and cache_key:
             cleanup_file_safe(result_path)
 
@@ -2057,8 +2116,7 @@ async def process_classification_mode(
         texts_series = df.iloc[:, 0].astype(str)
         
         mask = (
-            ~texts_series.str.startswith('/') &
-            ~texts_series.str.endswith(('.png', '.jpg', '.pdf', '.jpeg', '.gif')) &
+            ~texts_series.str.contains(JUNK_TEXT_PATTERN) &
             (texts_series.str.len() > 5)
         )
         
@@ -2107,7 +2165,7 @@ async def process_classification_mode(
                     details=f"Осталось ~{(total-current)*1.5//60} мин"
                 )
         
-        result_df = classifier.classify_batch(
+        result_df = await classifier.aclassify_batch(
             texts,
             categories,
             descriptions,
@@ -2119,6 +2177,8 @@ async def process_classification_mode(
         await tracker.update(stage="💾 Сохранение результатов", percent=95)
         
         result_path = f"/tmp/{user_id}_classified_{filename}"
+        # В памяти уверенность — float32; в файл — исходные значения (0.9, а не 0.8999999)
+        result_df['confidence'] = confidence_as_float64(result_df['confidence'])
         result_df.to_csv(result_path, index=False, encoding='utf-8')
         
         logger.info(f"✅ CLASSIFICATION COMPLETE | User: {user_id} | Texts: {n_texts}")
@@ -2170,13 +2230,12 @@ async def process_classification_mode(
         except:
             pass
         
-        with open(result_path, 'rb') as result_file:
-            await message.reply_document(
-                document=result_file,
-                filename=f"classified_{filename}",
-                caption=stats_msg,
-                parse_mode='HTML'
-            )
+        await message.reply_document(
+            document=await read_document(result_path),
+            filename=f"classified_{filename}",
+            caption=stats_msg,
+            parse_mode='HTML'
+        )
         
         cleanup_file_safe(result_path)
         
@@ -2396,7 +2455,7 @@ async def handle_insight_request(update: Update, context: ContextTypes.DEFAULT_T
     cache_key = "_".join(parts[2:])  # cache_key может содержать подчёркивания
     
     # Загружаем данные из кеша
-    cached_data = cache.load(cache_key)
+    cached_data = await cache.aload(cache_key)
     if not cached_data:
         await query.message.reply_text(
             "⚠️ <b>Данные устарели</b>\n\n"
@@ -2489,11 +2548,9 @@ async def handle_pdf_request(update: Update, context: ContextTypes.DEFAULT_TYPE)
     )
     
     try:
-        # Генерация с таймаутом
-        result = await asyncio.wait_for(
-            generate_detailed_report(cache_key, update.effective_user.id),
-            timeout=120  # 2 минуты макс
-        )
+        # Генерация с таймаутом (без отдельной задачи, как в wait_for)
+        async with asyncio.timeout(120):  # 2 минуты макс
+            result = await generate_detailed_report(cache_key, update.effective_user.id)
         
         if not result:
             logger.warning(f"⚠️ PDF GENERATION FAILED | User: {user_id} | Cache key: {cache_key[:8]}")
@@ -2518,30 +2575,32 @@ async def handle_pdf_request(update: Update, context: ContextTypes.DEFAULT_TYPE)
             parse_mode='HTML'
         )
         
-        # PDF
-        with open(pdf_path, 'rb') as pdf_file:
+        async def send_report_file(path: str, filename: str, caption: str):
             await query.message.reply_document(
-                document=pdf_file,
-                filename=f"detailed_report_{cache_key[:8]}.pdf",
-                caption=(
-                    "📊 <b>Детальный отчёт PDF</b>\n\n"
-                    "Содержит:\n"
-                    "• Полную статистику\n"
-                    "• Графики распределения\n"
-                    "• Топ-10 кластеров с примерами\n"
-                    "• Ключевые слова по каждой теме"
-                ),
+                document=await read_document(path),
+                filename=filename,
+                caption=caption,
                 parse_mode='HTML'
             )
         
-        # Extended CSV
-        with open(csv_path, 'rb') as csv_file:
-            await query.message.reply_document(
-                document=csv_file,
-                filename=f"extended_stats_{cache_key[:8]}.csv",
-                caption="📈 <b>Расширенная статистика</b>\n\nРаспределение по всем кластерам с процентами",
-                parse_mode='HTML'
+        # PDF и Extended CSV загружаем параллельно
+        await asyncio.gather(
+            send_report_file(
+                pdf_path,
+                f"detailed_report_{cache_key[:8]}.pdf",
+                "📊 <b>Детальный отчёт PDF</b>\n\n"
+                "Содержит:\n"
+                "• Полную статистику\n"
+                "• Графики распределения\n"
+                "• Топ-10 кластеров с примерами\n"
+                "• Ключевые слова по каждой теме"
+            ),
+            send_report_file(
+                csv_path,
+                f"extended_stats_{cache_key[:8]}.csv",
+                "📈 <b>Расширенная статистика</b>\n\nРаспределение по всем кластерам с процентами"
             )
+        )
         
         await progress_msg.delete()
         
@@ -2557,11 +2616,10 @@ async def handle_pdf_request(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
         
         # Очистка временных файлов
-        try:
-            Path(pdf_path).unlink()
-            Path(csv_path).unlink()
-        except:
-            pass
+        await asyncio.gather(
+            asyncio.to_thread(cleanup_file_safe, pdf_path),
+            asyncio.to_thread(cleanup_file_safe, csv_path)
+        )
         
     except asyncio.TimeoutError:
         logger.error(f"⏱ PDF TIMEOUT | User: {user_id} | Cache key: {cache_key[:8]}")
@@ -2599,6 +2657,42 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     logger.error("=" * 60)
 
 
+async def close_http_clients(application: Application):
+    """Закрывает общие HTTP-клиенты классификатора и генератора категорий при остановке бота"""
+    if classifier:
+        await classifier.aclose()
+    if category_generator:
+        await category_generator.aclose()
+
+
+def build_callback_dispatcher(routes):
+    """
+    Собирает один обработчик для всех callback-кнопок
+    
+    Вместо отдельного regex на каждый CallbackQueryHandler все шаблоны
+    объединяются в одну альтернацию с именованными группами: один match
+    на callback, обработчик выбирается по имени совпавшей группы.
+    
+    Args:
+        routes: [(pattern, handler), ...] в порядке приоритета
+    
+    Returns:
+        (compiled_pattern, dispatch_coroutine)
+    """
+    pattern = re.compile("|".join(
+        f"(?P<route{i}>{route_pattern})"
+        for i, (route_pattern, _) in enumerate(routes)
+    ))
+    handlers = {f"route{i}": handler for i, (_, handler) in enumerate(routes)}
+
+    async def dispatch(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        match = pattern.match(update.callback_query.data or "")
+        if match:
+            await handlers[match.lastgroup](update, context)
+
+    return pattern, dispatch
+
+
 def main():
     logger.info("=" * 60)
     logger.info("🤖 BOT STARTING...")
@@ -2610,14 +2704,23 @@ def main():
     logger.info("🗑️ Cleaning up old temp files...")
     cleanup_old_temp_files()
     
+    # numba-компиляция UMAP — при старте, а не на первой кластеризации
+    warmup_umap()
+    
     logger.info("=" * 60)
     
     # Создаём application с job_queue
     from telegram.ext import JobQueue
 
+    # concurrent_updates: долгий обработчик одного пользователя (PDF, классификация)
+    # не задерживает апдейты остальных
     application = (
         Application.builder()
         .token(TOKEN)
+        .concurrent_updates(True)
+        .connection_pool_size(64)
+        .pool_timeout(10)
+        .post_shutdown(close_http_clients)
         .build()
     )
 
@@ -2632,26 +2735,7 @@ def main():
     application.add_handler(CommandHandler("feedback", feedback_command))
     application.add_handler(CommandHandler("stats", stats_command))
     from telegram.ext import CallbackQueryHandler
-    # Обработчики для автогенерации категорий
-    application.add_handler(CallbackQueryHandler(
-        handle_category_method_choice,
-        pattern="^cat_method_"
-    ))
-    
-    application.add_handler(CallbackQueryHandler(
-        handle_prompt_customization_choice,
-        pattern="^use_default_|^customize_"
-    ))
-    
-    application.add_handler(CallbackQueryHandler(
-        handle_generated_categories_action,
-pattern="^approve_generated_cats$|^edit_generated_cats$|^regenerate_cats$|^show_generated_cats_again$"
-    ))
 
-    application.add_handler(CallbackQueryHandler(handle_mode_selection, pattern="^mode_|^show_help$|^back_to_start$"))
-    application.add_handler(CallbackQueryHandler(handle_pdf_request, pattern="^pdf_"))
-    application.add_handler(CallbackQueryHandler(handle_insight_request, pattern="^insight_"))
-    application.add_handler(CallbackQueryHandler(handle_share_request, pattern="^share_"))
     async def handle_csv_only(update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
         await query.answer()
@@ -2661,17 +2745,34 @@ pattern="^approve_generated_cats$|^edit_generated_cats$|^regenerate_cats$|^show_
             "Хотите проанализировать другие тексты? Отправляйте новый файл!"
         )
 
-    application.add_handler(CallbackQueryHandler(handle_csv_only, pattern="^csv_only$"))
-    application.add_handler(CallbackQueryHandler(handle_classification_mode_choice, pattern="^class_"))
+    # Маршруты callback-кнопок (порядок важен — срабатывает первый совпавший)
+    callback_routes = [
+        # Автогенерация категорий
+        ("^cat_method_", handle_category_method_choice),
+        ("^use_default_|^customize_", handle_prompt_customization_choice),
+        (
+            "^approve_generated_cats$|^edit_generated_cats$|^regenerate_cats$|^show_generated_cats_again$",
+            handle_generated_categories_action
+        ),
+        ("^mode_|^show_help$|^back_to_start$", handle_mode_selection),
+        ("^pdf_", handle_pdf_request),
+        ("^insight_", handle_insight_request),
+        ("^share_", handle_share_request),
+        ("^csv_only$", handle_csv_only),
+        ("^class_", handle_classification_mode_choice),
+        # Квиз
+        ("^show_quiz$", show_quiz),
+        ("^quiz_q1_", handle_quiz_q1),
+        ("^quiz_q2_", handle_quiz_q2),
+        ("^quiz_q3_", handle_quiz_result),
+        ("^quiz_back_", handle_quiz_back),
+    ]
+    callback_pattern, dispatch_callback = build_callback_dispatcher(callback_routes)
+    application.add_handler(CallbackQueryHandler(dispatch_callback, pattern=callback_pattern))
+
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_categories_input))
     application.add_handler(MessageHandler(filters.Document.ALL, handle_file))
     application.add_error_handler(error_handler)
-    # Обработчики квиза
-    application.add_handler(CallbackQueryHandler(show_quiz, pattern="^show_quiz$"))
-    application.add_handler(CallbackQueryHandler(handle_quiz_q1, pattern="^quiz_q1_"))
-    application.add_handler(CallbackQueryHandler(handle_quiz_q2, pattern="^quiz_q2_"))
-    application.add_handler(CallbackQueryHandler(handle_quiz_result, pattern="^quiz_q3_"))
-    application.add_handler(CallbackQueryHandler(handle_quiz_back, pattern="^quiz_back_"))
 
 
     # Периодические задачи
@@ -2700,7 +2801,18 @@ pattern="^approve_generated_cats$|^edit_generated_cats$|^regenerate_cats$|^show_
     logger.info("🚀 Bot is running and ready to accept requests!")
     logger.info("=" * 60)
     
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if WEBHOOK_URL:
+        # Telegram сам присылает обновления — без задержки цикла getUpdates
+        logger.info(f"🌐 Webhook mode | Listen: {WEBHOOK_LISTEN}:{WEBHOOK_PORT}")
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=TOKEN,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{TOKEN}",
+            allowed_updates=Update.ALL_TYPES
+        )
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
 if __name__ == '__main__':
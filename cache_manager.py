@@ -1,23 +1,34 @@
 # cache_manager.py
+import os
+import asyncio
+import heapq
 import pickle
 import hashlib
 import time
 from pathlib import Path
 from typing import Optional, Dict, Any
-from config import CACHE_DIR, MAX_CACHE_AGE_SECONDS, MAX_CACHE_ITEMS
+import pandas as pd
+from config import CACHE_DIR, CATEGORY_CACHE_DIR, MAX_CACHE_AGE_SECONDS, MAX_CACHE_ITEMS
 
 class ClusteringCache:
     """Кэш результатов кластеризации для генерации PDF"""
     
+    # Очистка запускается не на каждую запись, а раз в N записей или по таймеру
+    CLEANUP_EVERY_N_WRITES = 8
+    CLEANUP_INTERVAL_SECONDS = 300
+    
     def __init__(self):
         self.cache_dir = CACHE_DIR
+        self._writes_since_cleanup = 0
+        self._last_cleanup = 0.0
         self._cleanup_old_cache()
     
     def _get_cache_key(self, user_id: int, file_name: str) -> str:
         """Генерирует ключ кэша: user_id + timestamp"""
         timestamp = int(time.time())
         raw = f"{user_id}_{file_name}_{timestamp}"
-        return hashlib.md5(raw.encode()).hexdigest()
+        # blake2b быстрее md5 на коротких строках; digest_size=16 даёт те же 32 hex-символа
+        return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
     
     def save(self, user_id: int, file_name: str, data: Dict[str, Any]) -> str:
         """
@@ -43,45 +54,107 @@ class ClusteringCache:
         data['timestamp'] = time.time()
         data['user_id'] = user_id
         
+        # DataFrame храним отдельно в Feather (колоночный формат, быстрое чтение),
+        # в pickle остаются только небольшие метаданные.
+        # zstd сжимает текстовые колонки в разы сильнее lz4 при сопоставимой скорости
+        meta = {k: v for k, v in data.items() if k != 'df'}
+        if data.get('df') is not None:
+            data['df'].to_feather(
+                cache_path.with_suffix('.feather'),
+                compression='zstd',
+                compression_level=3
+            )
+        
         with open(cache_path, 'wb') as f:
-            pickle.dump(data, f)
+            pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
         
-        self._cleanup_old_cache()
+        # Возраст всё равно проверяется в load(), поэтому чистим реже
+        self._writes_since_cleanup += 1
+        if (self._writes_since_cleanup >= self.CLEANUP_EVERY_N_WRITES
+                or time.time() - self._last_cleanup > self.CLEANUP_INTERVAL_SECONDS):
+            self._cleanup_old_cache()
         return cache_key
     
     def load(self, cache_key: str) -> Optional[Dict[str, Any]]:
         """Загружает данные из кэша"""
         cache_path = self.cache_dir / f"{cache_key}.pkl"
         
-        if not cache_path.exists():
+        # Один stat: и проверка существования, и возраст
+        try:
+            st = cache_path.stat()
+        except FileNotFoundError:
             return None
         
-        # Проверка возраста
-        age = time.time() - cache_path.stat().st_mtime
-        if age > MAX_CACHE_AGE_SECONDS:
-            cache_path.unlink()
+        if time.time() - st.st_mtime > MAX_CACHE_AGE_SECONDS:
+            self._remove(cache_path)
             return None
         
-        with open(cache_path, 'rb') as f:
-            return pickle.load(f)
+        with open(cache_path, 'rb', buffering=1 << 20) as f:
+            data = pickle.load(f)
+        
+        df_path = cache_path.with_suffix('.feather')
+        if df_path.exists():
+            data['df'] = pd.read_feather(df_path)
+        
+        return data
+    
+    async def asave(self, user_id: int, file_name: str, data: Dict[str, Any]) -> str:
+        """Асинхронная обёртка над save: запись файлов идёт в отдельном потоке"""
+        return await asyncio.to_thread(self.save, user_id, file_name, data)
+    
+    async def aload(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Асинхронная обёртка над load, не блокирует event loop"""
+        return await asyncio.to_thread(self.load, cache_key)
+    
+    @staticmethod
+    def _remove(cache_path: Path):
+        """Удаляет файл кэша вместе с Feather-файлом датафрейма"""
+        cache_path.unlink(missing_ok=True)
+        cache_path.with_suffix('.feather').unlink(missing_ok=True)
     
     def _cleanup_old_cache(self):
         """Удаляет старые файлы кэша"""
-        cache_files = sorted(
-            self.cache_dir.glob("*.pkl"),
-            key=lambda p: p.stat().st_mtime,
-            reverse=True
-        )
-        
-        # Удаляем старые файлы (больше лимита)
-        for old_file in cache_files[MAX_CACHE_ITEMS:]:
-            old_file.unlink()
-        
-        # Удаляем устаревшие
-        now = time.time()
-        for cache_file in cache_files:
-            if now - cache_file.stat().st_mtime > MAX_CACHE_AGE_SECONDS:
-                cache_file.unlink()
+        self._writes_since_cleanup = 0
+        self._last_cleanup = time.time()
+        self._cleanup_category_cache()
+        
+        # Один проход scandir: mtime берётся из DirEntry без отдельного stat на файл
+        with os.scandir(self.cache_dir) as it:
+            entries = [
+                (entry.stat().st_mtime, entry.path)
+                for entry in it
+                if entry.name.endswith('.pkl')
+            ]
+        
+        cutoff = time.time() - MAX_CACHE_AGE_SECONDS
+        to_remove = {path for mtime, path in entries if mtime < cutoff}
+        n_over_limit = len(entries) - MAX_CACHE_ITEMS
+        
+        # Быстрый путь: лимит не превышен и устаревших нет
+        if n_over_limit <= 0 and not to_remove:
+            return
+        
+        # Удаляем самые старые файлы сверх лимита (без полной сортировки)
+        if n_over_limit > 0:
+            to_remove.update(path for _, path in heapq.nsmallest(n_over_limit, entries))
+        
+        for path in to_remove:
+            self._remove(Path(path))
+    
+    @staticmethod
+    def _cleanup_category_cache():
+        """Удаляет устаревшие файлы кэша сгенерированных категорий"""
+        cutoff = time.time() - MAX_CACHE_AGE_SECONDS
+        try:
+            with os.scandir(CATEGORY_CACHE_DIR) as it:
+                expired = [
+                    entry.path for entry in it
+                    if entry.name.endswith('.json') and entry.stat().st_mtime < cutoff
+                ]
+        except FileNotFoundError:
+            return
+        for path in expired:
+            Path(path).unlink(missing_ok=True)
 
 # Глобальный экземпляр
 cache = ClusteringCache()
@@ -1,15 +1,49 @@
 # category_generator.py
 import logging
-import random
-import json
 import html
 import re
+import time
+import hashlib
+from pathlib import Path
 from typing import List, Optional, Tuple
-from dataclasses import dataclass
-import requests
+from dataclasses import dataclass, asdict
+import httpx
+import numpy as np
+import orjson
+from config import CATEGORY_CACHE_DIR, MAX_CACHE_AGE_SECONDS
 
 logger = logging.getLogger(__name__)
 
+# <br/> → перенос строки, остальные HTML-теги удаляются (один проход)
+HTML_TAG_PATTERN = re.compile(r'(<br\s*/?>)|<[^>]+>', re.IGNORECASE)
+
+# Содержимое markdown-блока ```json ... ``` в ответе модели (до закрывающего
+# ``` или до конца текста); валидность JSON проверяет уже декодер
+CODE_BLOCK_PATTERN = re.compile(r'```(?:json)?(.*?)(?:```|\Z)', re.DOTALL)
+
+# Номера категорий при показе пользователю
+DIGIT_EMOJI = ("1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟")
+
+
+def _replace_tag(match: re.Match) -> str:
+    return '\n' if match.group(1) else ''
+
+
+def clean_html(text: str) -> str:
+    """Удаляет HTML-теги, оставляет текст"""
+    if not text:
+        return ""
+    return HTML_TAG_PATTERN.sub(_replace_tag, text).strip()
+
+
+def extract_code_block(text: str) -> str:
+    """Достаёт содержимое первого markdown-блока ``` из ответа модели"""
+    code_block = CODE_BLOCK_PATTERN.search(text)
+    if code_block:
+        text = code_block.group(1)
+    return text.strip()
+
+
 @dataclass
 class CategorySuggestion:
     """Сгенерированная категория"""
@@ -48,6 +82,61 @@ class CategoryGenerator:
         self.api_key = api_key
         self.folder_id = folder_id
         self.url = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+        
+        # Кэш ответов по шаблону промта и выборке: повторная загрузка того же
+        # файла не идёт в API (устаревшие файлы удаляет очистка cache_manager)
+        self.cache_dir = CATEGORY_CACHE_DIR
+        
+        # Один клиент на всё время работы: keep-alive вместо нового TLS на каждый запрос
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Общий httpx-клиент с заголовками авторизации"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=60,
+                headers={
+                    "Authorization": f"Api-Key {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=32)
+            )
+        return self._client
+    
+    async def aclose(self):
+        """Закрывает HTTP-клиент (при остановке бота)"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    def _cache_path(self, prompt_template: str, sample_for_prompt: List[str]) -> Path:
+        """
+        Путь к файлу кэша: шаблон промта + отсортированная выборка,
+        так что та же выборка в другом порядке попадает в тот же ключ
+        """
+        key_source = prompt_template + "\n" + "\n".join(sorted(sample_for_prompt))
+        key = hashlib.blake2b(key_source.encode(), digest_size=16).hexdigest()
+        return self.cache_dir / f"{key}.json"
+    
+    def _load_cached(self, cache_path: Path) -> Optional[List[CategorySuggestion]]:
+        """Категории из кэша или None, если их нет или они устарели"""
+        try:
+            if time.time() - cache_path.stat().st_mtime > MAX_CACHE_AGE_SECONDS:
+                cache_path.unlink(missing_ok=True)
+                return None
+            return [CategorySuggestion(**cat) for cat in orjson.loads(cache_path.read_bytes())]
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"⚠️ Broken category cache {cache_path.name}: {e}")
+            return None
+    
+    def _save_cached(self, cache_path: Path, categories: List[CategorySuggestion]):
+        """Сохраняет категории в кэш"""
+        try:
+            cache_path.write_bytes(orjson.dumps([asdict(cat) for cat in categories]))
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to cache categories: {e}")
     
     def get_sample(self, texts: List[str], max_size: int = 1000) -> List[str]:
         """Получить репрезентативную выборку"""
@@ -62,23 +151,31 @@ class CategoryGenerator:
         
         sample_size = min(sample_size, max_size)
         
-        # Случайная выборка
+        # Случайная выборка: numpy выбирает индексы одним вызовом, без копии списка.
+        # Seed — хэш содержимого: тот же файл даёт ту же выборку (и попадание в кэш)
         if n > sample_size:
-            sample = random.sample(texts, sample_size)
+            digest = hashlib.blake2b("\n".join(texts).encode(), digest_size=8).digest()
+            rng = np.random.default_rng(int.from_bytes(digest, "little"))
+            indices = rng.choice(n, size=sample_size, replace=False)
+            sample = [texts[i] for i in indices]
         else:
             sample = texts
         
         logger.info(f"📊 Sample created: {len(sample)} texts from {n} total")
         return sample
     
-    def generate_categories(
+    async def generate_categories(
         self, 
         texts_sample: List[str],
-        custom_prompt: Optional[str] = None
+        custom_prompt: Optional[str] = None,
+        use_cache: bool = True
     ) -> Tuple[bool, Optional[List[CategorySuggestion]], Optional[str]]:
         """
         Генерация категорий
         
+        Args:
+            use_cache: False — принудительно запросить API (перегенерация)
+        
         Returns:
             (success, categories, error_message)
         """
@@ -88,16 +185,19 @@ class CategoryGenerator:
             
             # Берём до 100 текстов для промта (чтобы не превысить лимит токенов)
             sample_for_prompt = texts_sample[:100]
-            texts_str = "\n".join([f"{i+1}. {t[:200]}" for i, t in enumerate(sample_for_prompt)])
+            texts_str = "\n".join(f"{i}. {t[:200]}" for i, t in enumerate(sample_for_prompt, 1))
             
             prompt = prompt_template.format(texts=texts_str)
+            cache_path = self._cache_path(
+                prompt_template, [t[:200] for t in sample_for_prompt]
+            )
             
-            # Запрос к API
-            headers = {
-                "Authorization": f"Api-Key {self.api_key}",
-                "Content-Type": "application/json"
-            }
+            cached = self._load_cached(cache_path) if use_cache else None
+            if cached:
+                logger.info(f"✅ Categories loaded from cache ({len(cached)})")
+                return True, cached, None
             
+            # Запрос к API
             data = {
                 "modelUri": f"gpt://{self.folder_id}/yandexgpt-lite",
                 "completionOptions": {
@@ -118,45 +218,27 @@ class CategoryGenerator:
             
             logger.info("🤖 Sending request to YandexGPT for category generation")
             
-            response = requests.post(
-                self.url,
-                headers=headers,
-                json=data,
-                timeout=60
-            )
+            # Асинхронный запрос: ожидание ответа модели не блокирует бота
+            response = await self._get_client().post(self.url, content=orjson.dumps(data))
             
             if response.status_code != 200:
                 logger.error(f"YandexGPT API error: {response.status_code} - {response.text}")
                 return False, None, f"Ошибка API: {response.status_code}"
             
-            result = response.json()
+            result = orjson.loads(response.content)
             text_response = result['result']['alternatives'][0]['message']['text']
             
             # Парсим JSON
             try:
                 # Убираем markdown если есть
-                if "```json" in text_response:
-                    text_response = text_response.split("```json")[1].split("```")[0]
-                elif "```" in text_response:
-                    text_response = text_response.split("```")[1].split("```")[0]
+                text_response = extract_code_block(text_response)
                 
-                data = json.loads(text_response.strip())
+                data = orjson.loads(text_response)
                 categories_data = data.get('categories', [])
                 
                 if not categories_data:
                     return False, None, "API не вернул категории"
                 
-                # Функция очистки HTML-тегов
-                def clean_html(text: str) -> str:
-                    """Удаляет HTML-теги, оставляет текст"""
-                    if not text:
-                        return ""
-                    # <br/> → перенос строки
-                    text = re.sub(r'<br\s*/?>', '\n', text)
-                    # Удаляем остальные HTML-теги
-                    text = re.sub(r'<[^>]+>', '', text)
-                    return text.strip()
-                
                 # Преобразуем в CategorySuggestion
                 categories = []
                 for cat in categories_data:
@@ -167,13 +249,14 @@ class CategoryGenerator:
                     ))
                 
                 logger.info(f"✅ Generated {len(categories)} categories")
+                self._save_cached(cache_path, categories)
                 return True, categories, None
                 
-            except json.JSONDecodeError as e:
+            except orjson.JSONDecodeError as e:
                 logger.error(f"Failed to parse JSON: {e}\nResponse: {text_response}")
                 return False, None, "Не удалось распознать ответ от AI"
         
-        except requests.Timeout:
+        except httpx.TimeoutException:
             logger.error("YandexGPT request timeout")
             return False, None, "Превышено время ожидания"
         
@@ -183,28 +266,28 @@ class CategoryGenerator:
     
     def format_categories_for_display(self, categories: List[CategorySuggestion]) -> str:
         """Форматирование для показа пользователю"""
-        msg = f"🏷️ <b>Предложенные категории ({len(categories)}):</b>\n\n"
+        parts = [f"🏷️ <b>Предложенные категории ({len(categories)}):</b>\n\n"]
         
         for i, cat in enumerate(categories, 1):
-            emoji = ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟"][i-1] if i <= 10 else "▪️"
+            emoji = DIGIT_EMOJI[i-1] if i <= len(DIGIT_EMOJI) else "▪️"
             
             # Экранируем спецсимволы HTML
             safe_name = html.escape(cat.name)
             
-            msg += f"{emoji} <b>{safe_name}</b>\n"
+            parts.append(f"{emoji} <b>{safe_name}</b>\n")
             
             if cat.description:
                 safe_desc = html.escape(cat.description)
                 # Обрезаем длинные описания
                 if len(safe_desc) > 150:
                     safe_desc = safe_desc[:150] + "..."
-                msg += f"   <i>{safe_desc}</i>\n"
+                parts.append(f"   <i>{safe_desc}</i>\n")
             
             if cat.examples:
                 safe_examples = [html.escape(ex[:50]) for ex in cat.examples[:2]]
                 examples_str = "; ".join(safe_examples)
-                msg += f"   💬 Примеры: {examples_str}\n"
+                parts.append(f"   💬 Примеры: {examples_str}\n")
             
-            msg += "\n"
+            parts.append("\n")
         
-        return msg
+        return "".join(parts)
@@ -5,29 +5,664 @@
 
 import logging
 import os
-import json
+import sys
+import random
 import time
-from typing import List, Dict, Tuple
-import requests
+import asyncio
+import inspect
+import hashlib
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Dict, Tuple, Optional, FrozenSet, Union
+import httpx
+import msgspec
+import numpy as np
+import orjson
 import pandas as pd
 from tqdm import tqdm
+from embeddings import encode_texts, get_embedding_model
+from config import (
+    CACHE_DIR, EMBEDDING_MODEL, SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_THRESHOLD,
+    ZERO_SHOT_MODEL, ZERO_SHOT_THRESHOLD
+)
 
 logger = logging.getLogger(__name__)
 
+# Категория для текстов, которые не подходят ни под одну из заданных
+UNDEFINED_CATEGORY = "⚠️ Не удалось определить"
+
+
+# float32 хранит ~7 значащих цифр: округление при переводе в float64 возвращает
+# исходные значения (0.9, а не 0.8999999761581421)
+CONFIDENCE_DECIMALS = 6
+
+
+def confidence_as_float64(confidence: pd.Series) -> pd.Series:
+    """Уверенность из компактного float32 — в float64 для статистики и выгрузки."""
+    return confidence.astype('float64').round(CONFIDENCE_DECIMALS)
+
+
+def category_column(values: pd.Series, categories: List[str]) -> pd.Categorical:
+    """
+    Категории результата со стабильным словарём: категории пользователя в его
+    порядке, затем "не определено" и неизвестные ответы модели в порядке появления
+    (уникальные значения ищутся хэшированием в pandas, а не циклом по строкам).
+    """
+    known = frozenset(categories)
+    extra_categories = [
+        cat for cat in pd.unique(values)
+        if cat not in known and cat != UNDEFINED_CATEGORY
+    ]
+    return pd.Categorical(
+        values,
+        categories=[
+            *categories,
+            *([UNDEFINED_CATEGORY] if UNDEFINED_CATEGORY not in known else []),
+            *extra_categories
+        ]
+    )
+
+
+def strip_leading_number(s: str) -> str:
+    """Убирает нумерацию в начале категории ("1. Доставка" -> "Доставка")."""
+    n = len(s)
+    i = 0
+    # isdecimal/isspace — те же классы, что \d и \s в регулярках по str
+    while i < n and s[i].isdecimal():
+        i += 1
+    if i == 0 or i == n or s[i] != '.':
+        return s
+    j = i + 1
+    while j < n and s[j].isspace():
+        j += 1
+    return s[j:]
+
+
+# Коды служебных символов JSON для сканирования байтов
+OPEN_BRACE, CLOSE_BRACE, QUOTE, BACKSLASH = b"{}\"\\"
+OPEN_BRACKET, CLOSE_BRACKET = b"[]"
+APOSTROPHE, COMMA = b"',"
+JSON_WHITESPACE = b" \t\r\n"
+# Управляющие символы, которые модель оставляет внутри строк неэкранированными
+CONTROL_ESCAPES = {ord("\n"): b"\\n", ord("\r"): b"\\r", ord("\t"): b"\\t"}
+
+
+def find_json_object(data: bytes, allow_array: bool = False) -> Tuple[int, int]:
+    """
+    Находит границы первого JSON-объекта верхнего уровня за один проход.
+    
+    Работает с UTF-8 байтами: служебные символы JSON однобайтовые и не
+    встречаются внутри многобайтовых последовательностей, поэтому декодировать
+    ответ в str не нужно. Скобки внутри строк (с учётом экранирования)
+    не учитываются.
+    
+    Args:
+        data: Ответ модели
+        allow_array: Принимать и массив верхнего уровня ([...]), если он идёт раньше объекта
+    
+    Returns:
+        (start, end) для среза data[start:end] или (-1, -1), если объект не найден
+    """
+    start = data.find(b"{")
+    if allow_array:
+        array_start = data.find(b"[")
+        if array_start >= 0 and (start < 0 or array_start < start):
+            start = array_start
+    if start < 0:
+        return -1, -1
+    
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(data)):
+        c = data[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == BACKSLASH:
+                escaped = True
+            elif c == QUOTE:
+                in_string = False
+        elif c == QUOTE:
+            in_string = True
+        elif c == OPEN_BRACE or c == OPEN_BRACKET:
+            depth += 1
+        elif c == CLOSE_BRACE or c == CLOSE_BRACKET:
+            depth -= 1
+            if depth == 0:
+                return start, i + 1
+    
+    return -1, -1
+
+
+def repair_json(data: bytes) -> bytes:
+    """
+    Исправляет типичные ошибки модели в JSON за один проход.
+    
+    - висячие запятые перед } и ]
+    - строки в одинарных кавычках ('category': 'Доставка')
+    - неэкранированные переводы строк и табуляции внутри строк
+    """
+    out = bytearray()
+    quote = 0  # кавычка открытой строки (0 — вне строки)
+    escaped = False
+    n = len(data)
+    for i in range(n):
+        c = data[i]
+        if quote:
+            if escaped:
+                escaped = False
+                if not (quote == APOSTROPHE and c == APOSTROPHE):
+                    out.append(BACKSLASH)
+                out.append(c)
+            elif c == BACKSLASH:
+                escaped = True
+            elif c == quote:
+                quote = 0
+                out.append(QUOTE)
+            elif c == QUOTE:
+                out += b'\\"'
+            elif c in CONTROL_ESCAPES:
+                out += CONTROL_ESCAPES[c]
+            else:
+                out.append(c)
+        elif c == QUOTE or c == APOSTROPHE:
+            quote = c
+            out.append(QUOTE)
+        elif c == COMMA:
+            j = i + 1
+            while j < n and data[j] in JSON_WHITESPACE:
+                j += 1
+            if j == n or (data[j] != CLOSE_BRACE and data[j] != CLOSE_BRACKET):
+                out.append(c)
+        else:
+            out.append(c)
+    return bytes(out)
+
+
+def decode_tolerant(decoder: msgspec.json.Decoder, data: bytes):
+    """Декодирует JSON, при синтаксической ошибке — повторно после repair_json."""
+    try:
+        return decoder.decode(data)
+    except msgspec.ValidationError:
+        raise
+    except msgspec.DecodeError:
+        return decoder.decode(repair_json(data))
+
+
+def preview(data: bytes, limit: int = 200) -> str:
+    """Начало ответа модели для логов."""
+    return data[:limit].decode("utf-8", errors="replace")
+
+
+class AsyncRateLimiter:
+    """Равномерно распределяет запросы: не чаще одного за interval секунд."""
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next_slot = 0.0
+    
+    async def acquire(self):
+        """Ждёт своего слота (слоты выдаются по порядку вызова)."""
+        now = asyncio.get_running_loop().time()
+        wait = self._next_slot - now
+        self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+    
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        return False
+    
+    def adjust(self, success: bool):
+        """Обратная связь от API (фиксированный интервал её не использует)."""
+
+
+class AdaptiveLimiter(AsyncRateLimiter):
+    """
+    Rate limiter с подстройкой числа одновременных запросов (AIMD).
+    
+    После increase_every успешных ответов подряд лимит растёт на 1, на каждый
+    429 — уменьшается вдвое. Так параллелизм сходится к тому, что реально
+    выдерживает квота, без ручного подбора.
+    """
+    
+    def __init__(
+        self, interval: float, initial_limit: int, max_limit: int, increase_every: int = 10
+    ):
+        super().__init__(interval)
+        self.max_limit = max(1, max_limit)
+        self.limit = float(min(max(1, initial_limit), self.max_limit))
+        self.increase_every = increase_every
+        self._in_flight = 0
+        self._successes = 0
+        self._condition = asyncio.Condition()
+    
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < int(self.limit))
+            self._in_flight += 1
+        try:
+            await self.acquire()
+        except BaseException:
+            await self.__aexit__()
+            raise
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+        return False
+    
+    def adjust(self, success: bool):
+        if not success:
+            self.limit = max(1.0, self.limit * 0.5)
+            self._successes = 0
+            return
+        self._successes += 1
+        if self._successes >= self.increase_every:
+            self.limit = min(float(self.max_limit), self.limit + 1)
+            self._successes = 0
+
+
+class ResponseCache:
+    """
+    Постоянный кэш ответов модели в SQLite: переживает перезапуск бота.
+    Ключ — SHA-256 от модели, параметров генерации и промпта.
+    
+    set() только копит записи в памяти; flush() пишет их одной транзакцией.
+    Вызывающий код запускает flush() в потоке, когда set() сообщает о
+    FLUSH_EVERY накопленных записях, и в конце батча — так event loop не ждёт
+    fsync на каждый ответ.
+    """
+    
+    FLUSH_EVERY = 64
+    
+    def __init__(self, path: Path, ttl: float):
+        self.ttl = ttl
+        self._pending: Dict[str, Tuple[float, bytes]] = {}
+        # flush() вызывается и из потока (asyncio.to_thread), и из event loop
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, created_at REAL NOT NULL, response BLOB NOT NULL)"
+        )
+        # Просроченные записи удаляем один раз при открытии
+        self._db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - ttl,))
+        self._db.commit()
+    
+    @staticmethod
+    def make_key(model_uri: str, temperature: float, max_tokens: int, prompt: str) -> str:
+        raw = f"{model_uri}|{temperature}|{max_tokens}|{prompt}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+    
+    def get(self, key: str) -> Optional[bytes]:
+        pending = self._pending.get(key)
+        if pending is not None:
+            return pending[1]
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response FROM responses WHERE key = ? AND created_at >= ?",
+                (key, time.time() - self.ttl)
+            ).fetchone()
+        return row[0] if row else None
+    
+    def set(self, key: str, response: bytes) -> bool:
+        """Откладывает запись; True — накопилось FLUSH_EVERY записей, пора flush()."""
+        with self._lock:
+            self._pending[key] = (time.time(), response)
+            return len(self._pending) >= self.FLUSH_EVERY
+    
+    def flush(self):
+        """Записывает накопленные ответы одной транзакцией."""
+        with self._lock:
+            if not self._pending:
+                return
+            rows = [(key, created_at, response) for key, (created_at, response) in self._pending.items()]
+            self._pending = {}
+            self._db.executemany(
+                "INSERT OR REPLACE INTO responses (key, created_at, response) VALUES (?, ?, ?)",
+                rows
+            )
+            self._db.commit()
+
+
+class SemanticCache:
+    """
+    Кэш по смысловой близости для перефразированных текстов.
+    Хранит нормированные эмбеддинги и результаты классификации;
+    поиск — одно матрично-векторное произведение.
+    """
+    
+    def __init__(self, threshold: float = 0.92, max_entries: int = 10000):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._vectors: Optional[np.ndarray] = None
+        self._results: List[Dict[str, any]] = []
+        # Есть записи, не сохранённые на диск
+        self.dirty = False
+    
+    def __len__(self) -> int:
+        return len(self._results)
+    
+    def save(self, base: Path):
+        """Сохраняет индекс: <base>.npy (эмбеддинги) и <base>.json (результаты)."""
+        n = len(self._results)
+        if n == 0:
+            return
+        np.save(base.with_suffix(".npy"), self._vectors[:n])
+        base.with_suffix(".json").write_bytes(orjson.dumps(self._results))
+        self.dirty = False
+    
+    def load(self, base: Path) -> bool:
+        """Загружает индекс, сохранённый save(); False, если файлов нет."""
+        vectors_path = base.with_suffix(".npy")
+        results_path = base.with_suffix(".json")
+        if not (vectors_path.exists() and results_path.exists()):
+            return False
+        
+        vectors = np.load(vectors_path).astype(np.float32, copy=False)
+        results = orjson.loads(results_path.read_bytes())[:self.max_entries]
+        self._vectors = vectors[:len(results)]
+        self._results = results
+        self.dirty = False
+        return True
+    
+    def lookup(self, vector: np.ndarray) -> Optional[Dict[str, any]]:
+        """Результат для ближайшего текста, если сходство не ниже порога."""
+        n = len(self._results)
+        if n == 0:
+            return None
+        
+        sims = self._vectors[:n] @ vector
+        best = int(np.argmax(sims))
+        if sims[best] >= self.threshold:
+            return dict(self._results[best])
+        return None
+    
+    def add(self, vector: np.ndarray, result: Dict[str, any]):
+        """Добавляет эмбеддинг и результат (матрица растёт удвоением)."""
+        n = len(self._results)
+        if n >= self.max_entries:
+            return
+        
+        if self._vectors is None:
+            self._vectors = np.empty((256, vector.shape[0]), dtype=np.float32)
+        elif n == len(self._vectors):
+            grown = np.empty((2 * n, vector.shape[0]), dtype=np.float32)
+            grown[:n] = self._vectors
+            self._vectors = grown
+        
+        self._vectors[n] = vector
+        self._results.append(dict(result))
+        self.dirty = True
+
+
+class ClassificationResult(msgspec.Struct):
+    """Ответ модели по одному тексту (category = None, если не подходит ни одна)."""
+    category: Optional[str] = None
+    confidence: float = 0.0
+    reasoning: Optional[str] = ""
+
+
+class BatchClassificationItem(msgspec.Struct):
+    """Элемент пакетного ответа: id — номер текста в промпте."""
+    id: int
+    category: Optional[str] = None
+    confidence: float = 0.0
+    reasoning: Optional[str] = ""
+
+
+class BatchClassificationResult(msgspec.Struct):
+    results: List[BatchClassificationItem] = []
+
+
+# Декодеры со схемой: разбор и проверка типов за один проход.
+# strict=False допускает числа в строках ("confidence": "0.9")
+RESULT_DECODER = msgspec.json.Decoder(ClassificationResult, strict=False)
+# Пакетный ответ: {"results": [...]} по инструкции, но модель иногда отдаёт голый массив
+BATCH_RESULT_DECODER = msgspec.json.Decoder(
+    Union[BatchClassificationResult, List[BatchClassificationItem]], strict=False
+)
+
+
+CLASSIFICATION_RULES = """Важно:
+- Используй точное название категории из списка (учитывай регистр)
+- Если категория написана с ошибкой – не исправляй её
+- Если текст НЕ подходит ни под одну категорию - используй null 
+- НЕ добавляй номера типа "1.", "2." и т.д.
+- confidence должен быть числом от 0 до 1
+"""
+
+REASONING_RULE = "- reasoning - краткое объяснение (1-2 предложения)\n"
+
+CLASSIFICATION_INSTRUCTIONS = """Проанализируй текст, приведённый в конце, и выбери ОДНУ наиболее подходящую категорию из списка выше.
+
+Ответ верни СТРОГО в формате JSON:
+{schema}
+
+"""
+
+BATCH_CLASSIFICATION_INSTRUCTIONS = """Проанализируй пронумерованные тексты, приведённые в конце, и для КАЖДОГО выбери ОДНУ наиболее подходящую категорию из списка выше.
+
+Ответ верни СТРОГО в формате JSON:
+{{
+    "results": [
+        {schema}
+    ]
+}}
+
+"""
+
+
+def build_classification_instructions(batch: bool = False, include_reasoning: bool = False) -> str:
+    """
+    Инструкции по формату ответа.
+    
+    Без reasoning модель возвращает только категорию и уверенность —
+    ответ в несколько раз короче.
+    """
+    if batch:
+        schema = '{"id": 1, "category": "название_категории_БЕЗ_НОМЕРА", "confidence": 0.95'
+        schema += ', "reasoning": "краткое объяснение выбора"}' if include_reasoning else '}'
+        instructions = BATCH_CLASSIFICATION_INSTRUCTIONS.format(schema=schema)
+    else:
+        schema = '{\n    "category": "название_категории_БЕЗ_НОМЕРА",\n    "confidence": 0.95'
+        schema += ',\n    "reasoning": "краткое объяснение выбора"\n}' if include_reasoning else '\n}'
+        instructions = CLASSIFICATION_INSTRUCTIONS.format(schema=schema)
+    
+    instructions += CLASSIFICATION_RULES
+    if include_reasoning:
+        instructions += REASONING_RULE
+    if batch:
+        instructions += "- В results ровно один элемент на каждый текст, id - номер текста\n"
+    return instructions
+
 
 class LLMClassifier:
     """Классификатор текстов с использованием YandexGPT."""
     
-    def __init__(self):
-        """Инициализация классификатора."""
+    MODEL_NAME = "yandexgpt-lite"
+    TEMPERATURE = 0.3
+    # Ответы кэшируются только при низкой температуре (почти детерминированный ответ)
+    MAX_CACHEABLE_TEMPERATURE = 0.3
+    MAX_CACHE_ENTRIES = 10000
+    RESPONSE_CACHE_TTL = 7 * 24 * 3600
+    MAX_SEMANTIC_INDEXES = 16
+    # Тексты короче (после strip) не отправляются в модель
+    MIN_TEXT_LENGTH = 3
+    # Сколько текстов упаковывать в один запрос и сколько токенов ответа на текст
+    TEXTS_PER_REQUEST = 10
+    MAX_TOKENS = 500
+    MAX_TOKENS_PER_TEXT = 200
+    # Без reasoning ответ — только категория и уверенность
+    SHORT_MAX_TOKENS = 80
+    SHORT_MAX_TOKENS_PER_TEXT = 50
+    # HTTP/2: все параллельные запросы мультиплексируются в одном соединении
+    MAX_CONNECTIONS = 16
+    # Повторы только для временных ошибок (429/5xx, сеть); прочие 4xx — сразу ошибка
+    MAX_ATTEMPTS = 5
+    RETRY_BACKOFF = 0.5
+    RETRY_MAX_DELAY = 60.0
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+    
+    def __init__(
+        self,
+        cache_enabled: bool = True,
+        cache_ttl: float = 3600,
+        semantic_cache_enabled: bool = SEMANTIC_CACHE_ENABLED,
+        semantic_threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        zero_shot_model: str = ZERO_SHOT_MODEL,
+        zero_shot_threshold: float = ZERO_SHOT_THRESHOLD,
+        response_cache_path: Optional[Path] = CACHE_DIR / "llm_responses.sqlite",
+        semantic_cache_dir: Optional[Path] = CACHE_DIR / "semantic",
+        include_reasoning: bool = False
+    ):
+        """
+        Инициализация классификатора.
+        
+        Args:
+            cache_enabled: Кэшировать ответы для повторяющихся текстов
+            cache_ttl: Время жизни записи кэша (сек)
+            semantic_cache_enabled: Переиспользовать ответы для перефразированных текстов
+                (по умолчанию — SEMANTIC_CACHE_ENABLED из .env, выключен)
+            semantic_threshold: Минимальное косинусное сходство для семантического кэша
+            zero_shot_model: Локальная NLI-модель для zero-shot предклассификации
+                (пустая строка — отключена)
+            zero_shot_threshold: Минимальный score локальной модели, при котором
+                запрос к YandexGPT не нужен
+            response_cache_path: Файл SQLite для постоянного кэша ответов
+                (None — без постоянного кэша)
+            semantic_cache_dir: Каталог для сохранения семантических индексов
+                между запусками (None — только в памяти)
+            include_reasoning: Просить у модели объяснение выбора
+                (в несколько раз больше токенов ответа)
+        """
         self.api_key = os.getenv("YANDEX_API_KEY")
         self.folder_id = os.getenv("YANDEX_FOLDER_ID")
         self.api_url = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
         
+        # Кэш ответов: {ключ: (время записи, результат)}
+        self.cache_enabled = cache_enabled
+        self.cache_ttl = cache_ttl
+        self._cache: Dict[str, Tuple[float, Dict[str, any]]] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.api_calls = 0
+        
+        # Семантический кэш: отдельный индекс на каждый набор категорий
+        self.semantic_cache_enabled = semantic_cache_enabled
+        self.semantic_threshold = semantic_threshold
+        self._semantic_caches: Dict[str, SemanticCache] = {}
+        self.semantic_cache_dir = semantic_cache_dir
+        if semantic_cache_dir is not None:
+            semantic_cache_dir.mkdir(parents=True, exist_ok=True)
+        self.semantic_hits = 0
+        
+        # Постоянный кэш сырых ответов модели (между перезапусками)
+        self._response_cache: Optional[ResponseCache] = None
+        self.disk_hits = 0
+        if cache_enabled and response_cache_path is not None:
+            try:
+                self._response_cache = ResponseCache(response_cache_path, self.RESPONSE_CACHE_TTL)
+            except sqlite3.Error as e:
+                logger.warning(f"Постоянный кэш ответов отключён: {e}")
+        
+        # Zero-shot предклассификатор: уверенные тексты не уходят в LLM
+        self.zero_shot_model = zero_shot_model
+        self.zero_shot_threshold = zero_shot_threshold
+        self._zero_shot = None
+        self.zero_shot_hits = 0
+        
+        # Правила (регулярка -> категория): совпавшие тексты не уходят ни в одну модель
+        self._rules: List[Tuple[re.Pattern, str, float]] = []
+        self.rule_hits = 0
+        
+        # Объяснения удлиняют ответ, а скорость упирается в токены ответа
+        self.include_reasoning = include_reasoning
+        if include_reasoning:
+            self.max_tokens, self.max_tokens_per_text = self.MAX_TOKENS, self.MAX_TOKENS_PER_TEXT
+        else:
+            self.max_tokens, self.max_tokens_per_text = self.SHORT_MAX_TOKENS, self.SHORT_MAX_TOKENS_PER_TEXT
+        
+        # Статические части промптов: {(категории, описания): префикс}
+        self._prompt_prefixes: Dict[Tuple, str] = {}
+        # Регистронезависимый поиск категорий: {категории: {нижний регистр: категория}}
+        self._category_lookups: Dict[FrozenSet[str], Dict[str, str]] = {}
+        
         if not self.api_key or not self.folder_id:
             raise ValueError(
                 "Для классификации необходимы YANDEX_API_KEY и YANDEX_FOLDER_ID в .env"
             )
+        
+        self._headers = {
+            "Authorization": f"Api-Key {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        # Шаблон тела запроса: на каждый вызов меняются только промпт и параметры
+        self._request_template = {
+            "modelUri": f"gpt://{self.folder_id}/{self.MODEL_NAME}",
+            "completionOptions": {
+                "stream": False,
+                "temperature": self.TEMPERATURE,
+                "maxTokens": 500
+            },
+            "messages": [
+                {
+                    "role": "user",
+                    "text": None
+                }
+            ]
+        }
+        
+        # Общий HTTP/2-клиент создаётся лениво — внутри работающего event loop
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    def _build_static_prompt(
+        self, categories: List[str], descriptions: Dict[str, str] = None, batch: bool = False
+    ) -> str:
+        """
+        Общая часть промпта (роль, категории, формат ответа, правила) — одна на весь батч.
+        
+        Всё статическое идёт до текста, поэтому у провайдера префикс
+        может переиспользоваться между запросами (prefix caching).
+        """
+        key = (tuple(categories), tuple(sorted((descriptions or {}).items())), batch)
+        prefix = self._prompt_prefixes.get(key)
+        if prefix is not None:
+            return prefix
+        
+        categories_text = "\n".join(
+            f"{i}. {cat}" + (f" - {descriptions[cat]}" if descriptions and cat in descriptions else "")
+            for i, cat in enumerate(categories, 1)
+        )
+        
+        prefix = f"""Ты - эксперт по классификации текстов. Твоя задача - определить, к какой категории относится текст.
+
+Доступные категории:
+{categories_text}
+
+{build_classification_instructions(batch, self.include_reasoning)}
+{"Тексты для классификации:" if batch else "Текст для классификации:"}
+"""
+        self._prompt_prefixes[key] = prefix
+        return prefix
+    
+    def _category_lookup(self, category_set: FrozenSet[str]) -> Dict[str, str]:
+        """Словарь {категория в нижнем регистре: категория}, один на набор категорий."""
+        lookup = self._category_lookups.get(category_set)
+        if lookup is None:
+            lookup = {cat.lower(): cat for cat in category_set}
+            self._category_lookups[category_set] = lookup
+        return lookup
     
     def _create_classification_prompt(
         self, text: str, categories: List[str], descriptions: Dict[str, str] = None
@@ -43,220 +678,872 @@ class LLMClassifier:
         Returns:
             Промпт для LLM
         """
-        categories_text = "\n".join([
-            f"{i+1}. {cat}" + (f" - {descriptions.get(cat, '')}" if descriptions and cat in descriptions else "")
-            for i, cat in enumerate(categories)
-        ])
+        # Текст — в самом конце, после всей статической части
+        return self._build_static_prompt(categories, descriptions) + '"' + text + '"\nОтвет:'
+    
+    def _create_batch_prompt(
+        self, texts: List[str], categories: List[str], descriptions: Dict[str, str] = None
+    ) -> str:
+        """Промпт для классификации нескольких текстов одним запросом (id = номер с 1)."""
+        texts_block = "\n".join(f'{i}. "{text}"' for i, text in enumerate(texts, 1))
+        return self._build_static_prompt(categories, descriptions, batch=True) + texts_block + "\nОтвет:"
+    
+    def _build_payload(self, prompt: str, temperature: float, max_tokens: int = 500) -> bytes:
+        """
+        Тело запроса к YandexGPT (заголовки заданы в клиенте).
         
-        prompt = f"""Ты - эксперт по классификации текстов. Твоя задача - определить, к какой категории относится текст.
-
-Доступные категории:
-{categories_text}
-
-Текст для классификации:
-"{text}"
-
-Проанализируй текст и выбери ОДНУ наиболее подходящую категорию из списка выше.
-
-Ответ верни СТРОГО в формате JSON:
-{{
-    "category": "название_категории_БЕЗ_НОМЕРА",
-    "confidence": 0.95,
-    "reasoning": "краткое объяснение выбора"
-}}
-
-Важно:
-- Используй точное название категории из списка (учитывай регистр)
-- Если категория написана с ошибкой – не исправляй её
-- Если текст НЕ подходит ни под одну категорию - используй null 
-- НЕ добавляй номера типа "1.", "2." и т.д.
-- confidence должен быть числом от 0 до 1
-- reasoning - краткое объяснение (1-2 предложения)
-"""
-        return prompt
+        Шаблон собирается один раз в __init__, здесь подставляются только
+        изменяемые поля и сразу сериализуются — до ближайшего await, так что
+        параллельные корутины не видят чужие значения.
+        """
+        body = self._request_template
+        body["completionOptions"]["temperature"] = temperature
+        body["completionOptions"]["maxTokens"] = max_tokens
+        body["messages"][0]["text"] = prompt
+        return orjson.dumps(body)
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Возвращает общий httpx-клиент (keep-alive, HTTP/2)."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=True,
+                headers=self._headers,
+                timeout=30.0,
+                limits=httpx.Limits(
+                    max_connections=self.MAX_CONNECTIONS,
+                    max_keepalive_connections=self.MAX_CONNECTIONS
+                )
+            )
+        return self._client
+    
+    async def aclose(self):
+        """Закрывает HTTP-клиент (при остановке бота) и дописывает кэш ответов."""
+        if self._response_cache is not None:
+            await asyncio.to_thread(self._response_cache.flush)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """
+        Задержка перед повтором: Retry-After от сервера или экспонента с полным джиттером.
+        
+        Полный джиттер (равномерно от 0 до потолка) разводит по времени повторы
+        параллельных запросов, получивших 429 одновременно.
+        """
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.RETRY_MAX_DELAY)
+        return random.uniform(0, min(self.RETRY_MAX_DELAY, self.RETRY_BACKOFF * 2 ** attempt))
+    
+    async def _post_with_retry(
+        self, payload: bytes, limiter: Optional[AsyncRateLimiter] = None
+    ) -> httpx.Response:
+        """
+        POST к API с повторами на 429/5xx и сетевые ошибки.
+        
+        Остальные коды ошибок (400, 401, 403...) не повторяются — такой запрос
+        не пройдёт и со второй попытки, батч идёт дальше. Каждая попытка ждёт
+        слот limiter, а ответ (429 или нет) возвращается ему как обратная связь.
+        """
+        client = self._get_client()
+        
+        for attempt in range(self.MAX_ATTEMPTS):
+            last_attempt = attempt == self.MAX_ATTEMPTS - 1
+            try:
+                if limiter is not None:
+                    async with limiter:
+                        response = await client.post(self.api_url, content=payload)
+                    limiter.adjust(response.status_code != 429)
+                else:
+                    response = await client.post(self.api_url, content=payload)
+            except httpx.TransportError as e:
+                if last_attempt:
+                    raise
+                logger.warning("Сетевая ошибка YandexGPT, повтор %d: %s", attempt + 1, e)
+                await asyncio.sleep(self._retry_delay(attempt))
+                continue
+            
+            if response.status_code not in self.RETRY_STATUSES or last_attempt:
+                response.raise_for_status()
+                return response
+            
+            logger.warning("YandexGPT ответил %d, повтор %d", response.status_code, attempt + 1)
+            await asyncio.sleep(self._retry_delay(attempt, response))
     
-    def _call_yandex_gpt(self, prompt: str, temperature: float = 0.3) -> str:
+    async def _call_yandex_gpt(
+        self,
+        prompt: str,
+        temperature: float = 0.3,
+        max_tokens: int = 500,
+        limiter: Optional[AsyncRateLimiter] = None
+    ) -> str:
         """
         Вызов YandexGPT API.
         
         Args:
             prompt: Промпт для модели
             temperature: Температура генерации (0.0-1.0)
+            max_tokens: Лимит токенов ответа
+            limiter: Общий rate limiter батча
             
         Returns:
-            Ответ модели
+            Ответ модели в UTF-8 байтах (парсеры работают с bytes напрямую)
         """
-        headers = {
-            "Authorization": f"Api-Key {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "modelUri": f"gpt://{self.folder_id}/yandexgpt-lite",
-            "completionOptions": {
-                "stream": False,
-                "temperature": temperature,
-                "maxTokens": 500
-            },
-            "messages": [
-                {
-                    "role": "user",
-                    "text": prompt
-                }
-            ]
-        }
+        payload = self._build_payload(prompt, temperature, max_tokens)
         
         try:
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=data,
-                timeout=30
-            )
-            response.raise_for_status()
-            
-            result = response.json()
-            return result["result"]["alternatives"][0]["message"]["text"]
+            response = await self._post_with_retry(payload, limiter)
+            result = orjson.loads(response.content)
+            return result["result"]["alternatives"][0]["message"]["text"].encode()
             
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Ошибка при вызове YandexGPT: {e}")
+        except httpx.HTTPError as e:
+            logger.error("Ошибка при вызове YandexGPT: %s", e)
             raise
     
-    def _parse_classification_result(self, response: str) -> Tuple[str, float, str]:
+    async def _complete(
+        self, prompt: str, max_tokens: int = 500, limiter: Optional[AsyncRateLimiter] = None
+    ) -> bytes:
+        """
+        Ответ модели на промпт: из постоянного кэша или запросом к API.
+        
+        Попадание в кэш не ждёт rate limiter и не считается вызовом API.
+        """
+        key = None
+        if self._response_cache is not None and self.TEMPERATURE <= self.MAX_CACHEABLE_TEMPERATURE:
+            key = ResponseCache.make_key(
+                self._request_template["modelUri"], self.TEMPERATURE, max_tokens, prompt
+            )
+            cached = self._response_cache.get(key)
+            if cached is not None:
+                self.disk_hits += 1
+                return cached
+        
+        self.api_calls += 1
+        response = await self._call_yandex_gpt(
+            prompt, temperature=self.TEMPERATURE, max_tokens=max_tokens, limiter=limiter
+        )
+        
+        # Ответы без JSON не сохраняем — на следующем запуске спросим заново
+        if key is not None and find_json_object(response)[0] != -1:
+            if self._response_cache.set(key, response):
+                await asyncio.to_thread(self._response_cache.flush)
+        return response
+    
+    @staticmethod
+    def _parse_result_item(result: "ClassificationResult") -> Tuple[str, float, str]:
+        """Достаёт (категория, уверенность, объяснение) из ответа по одному тексту."""
+        category = result.category
+        
+        # Если модель вернула null - оставляем None
+        if category is None or category.lower() == "null":
+            category = None
+        else:
+            # Убираем номера только если категория не None
+            category = strip_leading_number(category)
+        
+        return (category, float(result.confidence), result.reasoning or "")
+    
+    def _parse_batch_result(self, response: bytes) -> Dict[int, Tuple[str, float, str]]:
+        """
+        Парсит ответ на пакетный промпт.
+        
+        Returns:
+            {id текста: (категория, уверенность, объяснение)}; пустой словарь,
+            если ответ разобрать не удалось
+        """
+        parsed = {}
+        try:
+            json_start, json_end = find_json_object(response, allow_array=True)
+            if json_start == -1:
+                logger.warning("Не удалось найти JSON в ответе: %s", preview(response))
+                return parsed
+            
+            batch = decode_tolerant(BATCH_RESULT_DECODER, response[json_start:json_end])
+            items = batch.results if isinstance(batch, BatchClassificationResult) else batch
+            for item in items:
+                parsed[item.id] = self._parse_result_item(item)
+        except Exception as e:
+            logger.warning("Ошибка парсинга пакетного ответа: %s\nОтвет: %s", e, preview(response))
+        
+        return parsed
+    
+    def _parse_classification_result(self, response: bytes) -> Tuple[str, float, str]:
         """Парсит ответ модели."""
         try:
-            json_start = response.find("{")
-            json_end = response.rfind("}") + 1
+            json_start, json_end = find_json_object(response)
             
-            if json_start != -1 and json_end > json_start:
-                json_str = response[json_start:json_end]
-                result = json.loads(json_str)
-                
-                category = result.get("category", None)
-                
-                # Если модель вернула null - оставляем None
-                if category is None or str(category).lower() == "null":
-                    category = None
-                else:
-                    # Убираем номера только если категория не None
-                    import re
-                    category = re.sub(r'^\d+\.\s*', '', str(category))
-                
-                confidence = float(result.get("confidence", 0.0))
-                reasoning = result.get("reasoning", "")
-                
-                return (category, confidence, reasoning)
+            if json_start != -1:
+                result = decode_tolerant(RESULT_DECODER, response[json_start:json_end])
+                return self._parse_result_item(result)
             else:
-                logger.warning(f"Не удалось найти JSON в ответе: {response[:200]}")
+                logger.warning("Не удалось найти JSON в ответе: %s", preview(response))
                 return ("", 0.0, "Ошибка парсинга")
                 
-        except json.JSONDecodeError as e:
-            logger.error(f"Ошибка парсинга JSON: {e}\nОтвет: {response[:200]}")
+        except msgspec.ValidationError as e:
+            logger.error("Ответ не соответствует схеме: %s\nОтвет: %s", e, preview(response))
+            return ("", 0.0, "Ошибка парсинга JSON")
+        except msgspec.DecodeError as e:
+            logger.error("Ошибка парсинга JSON: %s\nОтвет: %s", e, preview(response))
             return ("", 0.0, "Ошибка парсинга JSON")
         except Exception as e:
-            logger.error(f"Неожиданная ошибка при парсинге: {e}")
+            logger.error("Неожиданная ошибка при парсинге: %s", e)
             return ("", 0.0, f"Ошибка: {str(e)}")
 
 
     
-    def classify_text(
+    def _cache_context(
+        self, categories: List[str], descriptions: Dict[str, str] = None
+    ) -> bytes:
+        """Канонический JSON категорий и настроек модели — общая часть ключей кэша."""
+        return orjson.dumps(
+            {
+                "cats": categories,
+                "desc": descriptions,
+                "model": self.MODEL_NAME,
+                "temperature": self.TEMPERATURE,
+            },
+            option=orjson.OPT_SORT_KEYS
+        )
+    
+    def _make_cache_key(
         self,
         text: str,
         categories: List[str],
-        descriptions: Dict[str, str] = None
-    ) -> Dict[str, any]:
+        descriptions: Dict[str, str] = None,
+        cache_context: Optional[bytes] = None
+    ) -> str:
+        """Ключ кэша: SHA-256 от общей части (категории, модель) и текста."""
+        if cache_context is None:
+            cache_context = self._cache_context(categories, descriptions)
+        digest = hashlib.sha256(cache_context)
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+    
+    def _get_cached(self, key: str) -> Optional[Dict[str, any]]:
+        """Возвращает результат из кэша, если он есть и не устарел."""
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        
+        created_at, result = entry
+        if time.time() - created_at > self.cache_ttl:
+            del self._cache[key]
+            return None
+        
+        return dict(result)
+    
+    def _put_cached(self, key: str, result: Dict[str, any]):
+        """Сохраняет результат в кэш (самые старые записи вытесняются)."""
+        if len(self._cache) >= self.MAX_CACHE_ENTRIES:
+            del self._cache[next(iter(self._cache))]
+        self._cache[key] = (time.time(), dict(result))
+    
+    def _encode_texts(self, texts: List[str]) -> Optional[np.ndarray]:
         """
-        Классифицирует один текст.
+        Нормированные эмбеддинги текстов для семантического кэша.
+        Модель общая с кластеризацией (одна копия на процесс); если загрузить
+        её не удалось, семантический кэш отключается.
+        """
+        if not self.semantic_cache_enabled:
+            return None
         
-        Args:
-            text: Текст для классификации
-            categories: Список категорий
-            descriptions: Опциональные описания категорий
+        try:
+            return encode_texts(get_embedding_model(), texts, normalize=True)
+        except Exception as e:
+            logger.warning(f"Семантический кэш отключён: {e}")
+            self.semantic_cache_enabled = False
+            return None
+    
+    @staticmethod
+    def _compile_rule(
+        pattern: Union[str, re.Pattern], category: str, confidence: float = 1.0
+    ) -> Tuple[re.Pattern, str, float]:
+        """Правило классификации; строковые шаблоны — без учёта регистра."""
+        if isinstance(pattern, str):
+            pattern = re.compile(pattern, re.IGNORECASE)
+        return pattern, category, confidence
+    
+    def add_rule(
+        self, pattern: Union[str, re.Pattern], category: str, confidence: float = 1.0
+    ):
+        """
+        Добавляет детерминированное правило: текст, в котором найден pattern,
+        получает category без запроса к модели.
+        
+        Правило действует только в батчах, где category есть в списке категорий.
+        Правила проверяются в порядке добавления, срабатывает первое.
+        """
+        self._rules.append(self._compile_rule(pattern, category, confidence))
+    
+    def _match_rules(
+        self,
+        text: str,
+        category_set: FrozenSet[str],
+        rules: Optional[List[Tuple[re.Pattern, str, float]]] = None
+    ) -> Optional[Dict[str, any]]:
+        """Результат первого сработавшего правила или None."""
+        for pattern, category, confidence in (rules if rules is not None else self._rules):
+            if category in category_set and pattern.search(text):
+                self.rule_hits += 1
+                return {
+                    "category": category,
+                    "confidence": confidence,
+                    "reasoning": f"Правило: {pattern.pattern}"
+                }
+        return None
+    
+    def _zero_shot_classify(
+        self, texts: List[str], categories: List[str]
+    ) -> List[Optional[Dict[str, any]]]:
+        """
+        Локальная zero-shot классификация батчем.
+        
+        Модель загружается при первом вызове; если загрузить не удалось,
+        предклассификация отключается.
+        
+        Returns:
+            Результат для текстов с score >= zero_shot_threshold, иначе None
+        """
+        try:
+            if self._zero_shot is None:
+                import torch
+                from transformers import pipeline
+                self._zero_shot = pipeline(
+                    "zero-shot-classification",
+                    model=self.zero_shot_model,
+                    device=0 if torch.cuda.is_available() else -1
+                )
+                logger.info(f"✅ Zero-shot модель загружена: {self.zero_shot_model}")
             
+            outputs = self._zero_shot(
+                texts,
+                candidate_labels=categories,
+                hypothesis_template="Этот текст относится к категории «{}».",
+                multi_label=False,
+                batch_size=32
+            )
+        except Exception as e:
+            logger.warning(f"Zero-shot предклассификация отключена: {e}")
+            self.zero_shot_model = ""
+            return [None] * len(texts)
+        
+        if isinstance(outputs, dict):
+            outputs = [outputs]
+        
+        results = []
+        for output in outputs:
+            label, score = output["labels"][0], output["scores"][0]
+            if score >= self.zero_shot_threshold:
+                results.append({
+                    "category": label,
+                    "confidence": float(score),
+                    "reasoning": "Определено локальной zero-shot моделью"
+                })
+            else:
+                results.append(None)
+        return results
+    
+    def _get_semantic_cache(
+        self, categories: List[str], descriptions: Dict[str, str] = None
+    ) -> SemanticCache:
+        """
+        Семантический кэш для данного набора категорий.
+        При первом обращении индекс подгружается с диска, если он сохранялся.
+        """
+        # Модель эмбеддингов входит в ключ: векторы разных моделей несравнимы
+        key = hashlib.sha256(orjson.dumps(
+            {"cats": categories, "desc": descriptions, "model": EMBEDDING_MODEL},
+            option=orjson.OPT_SORT_KEYS
+        )).hexdigest()
+        
+        if key not in self._semantic_caches:
+            if len(self._semantic_caches) >= self.MAX_SEMANTIC_INDEXES:
+                evicted_key = next(iter(self._semantic_caches))
+                self._save_semantic_cache(evicted_key, self._semantic_caches.pop(evicted_key))
+            
+            semantic_cache = SemanticCache(
+                threshold=self.semantic_threshold,
+                max_entries=self.MAX_CACHE_ENTRIES
+            )
+            if self.semantic_cache_dir is not None:
+                try:
+                    if semantic_cache.load(self.semantic_cache_dir / key):
+                        logger.info(f"📂 Семантический кэш загружен: {len(semantic_cache)} записей")
+                except Exception as e:
+                    logger.warning(f"Не удалось загрузить семантический кэш: {e}")
+            self._semantic_caches[key] = semantic_cache
+        return self._semantic_caches[key]
+    
+    def _save_semantic_cache(self, key: str, semantic_cache: SemanticCache):
+        """Сохраняет индекс на диск, если в нём есть новые записи."""
+        if self.semantic_cache_dir is None or not semantic_cache.dirty:
+            return
+        try:
+            semantic_cache.save(self.semantic_cache_dir / key)
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить семантический кэш: {e}")
+    
+    def save_caches(self):
+        """Дописывает на диск кэш ответов и изменённые семантические индексы."""
+        if self._response_cache is not None:
+            self._response_cache.flush()
+        self.save_semantic_caches()
+    
+    def save_semantic_caches(self):
+        """Сохраняет все изменённые семантические индексы."""
+        for key, semantic_cache in list(self._semantic_caches.items()):
+            self._save_semantic_cache(key, semantic_cache)
+    
+    def _lookup_caches(
+        self,
+        text: str,
+        categories: List[str],
+        descriptions: Dict[str, str] = None,
+        embedding: Optional[np.ndarray] = None,
+        cache_context: Optional[bytes] = None
+    ) -> Tuple[Optional[Dict[str, any]], Optional[str], Optional[SemanticCache]]:
+        """
+        Ищет ответ в точном и семантическом кэшах.
+        
         Returns:
-            Словарь с результатами классификации
+            (результат или None, ключ кэша, семантический кэш) — ключ и
+            семантический кэш нужны, чтобы сохранить ответ модели после запроса
         """
-        prompt = self._create_classification_prompt(text, categories, descriptions)
-        response = self._call_yandex_gpt(prompt)
-        category, confidence, reasoning = self._parse_classification_result(response)
+        if not (self.cache_enabled and self.TEMPERATURE <= self.MAX_CACHEABLE_TEMPERATURE):
+            return None, None, None
+        
+        cache_key = self._make_cache_key(text, categories, descriptions, cache_context)
+        cached = self._get_cached(cache_key)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached, cache_key, None
+        self.cache_misses += 1
+        
+        semantic_cache = None
+        if embedding is not None:
+            semantic_cache = self._get_semantic_cache(categories, descriptions)
+            similar = semantic_cache.lookup(embedding)
+            if similar is not None:
+                self.semantic_hits += 1
+                self._put_cached(cache_key, similar)
+                return similar, cache_key, semantic_cache
+        
+        return None, cache_key, semantic_cache
+    
+    def _build_result(
+        self,
+        text: str,
+        categories: List[str],
+        parsed: Tuple[str, float, str],
+        cache_key: Optional[str] = None,
+        semantic_cache: Optional[SemanticCache] = None,
+        embedding: Optional[np.ndarray] = None,
+        category_set: Optional[FrozenSet[str]] = None
+    ) -> Dict[str, any]:
+        """Нормализует разобранный ответ модели и сохраняет результат в кэши."""
+        if category_set is None:
+            category_set = frozenset(categories)
+        category, confidence, reasoning = parsed
         
        # Если модель не смогла определить категорию
         if category is None or category == "" or str(category).lower() == "none":
-            logger.info(f"Модель не смогла определить категорию для: {text[:50]}...")
-            category = "⚠️ Не удалось определить"
+            logger.debug("Модель не смогла определить категорию для: %.50s...", text)
+            category = UNDEFINED_CATEGORY
             confidence = 1.0  # Высокая уверенность что не подходит
             reasoning = reasoning or "Текст не соответствует ни одной из заданных категорий"
         
         # Проверка что категория из списка (но пропускаем специальную категорию)
-        elif category not in categories:
-            logger.warning(f"Модель вернула неизвестную категорию: '{category}'")
-            # Можно тут либо оставить как есть, либо тоже пометить как "Не определено"
-            # Сейчас оставляем как есть - покажет что модель вернула
+        elif category not in category_set:
+            # Модель могла изменить регистр ("оплата" вместо "Оплата")
+            canonical = self._category_lookup(category_set).get(str(category).lower())
+            if canonical is not None:
+                category = canonical
+            else:
+                logger.warning("Модель вернула неизвестную категорию: '%s'", category)
+                # Можно тут либо оставить как есть, либо тоже пометить как "Не определено"
+                # Сейчас оставляем как есть - покажет что модель вернула
         
-        return {
+        result = {
             "category": category,
             "confidence": confidence,
             "reasoning": reasoning
         }
+        
+        if cache_key is not None:
+            self._put_cached(cache_key, result)
+        
+        # В семантический кэш — только ответы с категорией из списка
+        if semantic_cache is not None and category in category_set:
+            semantic_cache.add(embedding, result)
+        
+        return result
+    
+    async def classify_text(
+        self,
+        text: str,
+        categories: List[str],
+        descriptions: Dict[str, str] = None,
+        embedding: Optional[np.ndarray] = None,
+        category_set: Optional[FrozenSet[str]] = None,
+        limiter: Optional[AsyncRateLimiter] = None,
+        cache_context: Optional[bytes] = None
+    ) -> Dict[str, any]:
+        """
+        Классифицирует один текст.
+        
+        Args:
+            text: Текст для классификации
+            categories: Список категорий
+            descriptions: Опциональные описания категорий
+            embedding: Нормированный эмбеддинг текста (для семантического кэша)
+            category_set: frozenset(categories), если уже посчитан для батча
+            limiter: Общий rate limiter батча (ждём слот только перед запросом к API)
+            cache_context: self._cache_context(...), если уже посчитан для батча
+            
+        Returns:
+            Словарь с результатами классификации
+        """
+        if self._rules:
+            ruled = self._match_rules(text, category_set or frozenset(categories))
+            if ruled is not None:
+                return ruled
+        
+        cached, cache_key, semantic_cache = self._lookup_caches(
+            text, categories, descriptions, embedding, cache_context
+        )
+        if cached is not None:
+            return cached
+        
+        return await self._classify_uncached(
+            text, categories, descriptions, cache_key, semantic_cache,
+            embedding, category_set, limiter
+        )
+    
+    async def _classify_uncached(
+        self,
+        text: str,
+        categories: List[str],
+        descriptions: Dict[str, str],
+        cache_key: Optional[str],
+        semantic_cache: Optional[SemanticCache],
+        embedding: Optional[np.ndarray],
+        category_set: Optional[FrozenSet[str]],
+        limiter: Optional[AsyncRateLimiter]
+    ) -> Dict[str, any]:
+        """Одиночный запрос к модели для текста, которого нет в кэшах."""
+        prompt = self._create_classification_prompt(text, categories, descriptions)
+        response = await self._complete(prompt, max_tokens=self.max_tokens, limiter=limiter)
+        return self._build_result(
+            text, categories, self._parse_classification_result(response),
+            cache_key, semantic_cache, embedding, category_set
+        )
+    
+    async def classify_texts(
+        self,
+        texts: List[str],
+        categories: List[str],
+        descriptions: Dict[str, str] = None,
+        embeddings: Optional[np.ndarray] = None,
+        category_set: Optional[FrozenSet[str]] = None,
+        limiter: Optional[AsyncRateLimiter] = None,
+        cache_context: Optional[bytes] = None
+    ) -> List[Dict[str, any]]:
+        """
+        Классифицирует несколько текстов одним запросом к модели.
+        
+        Тексты, найденные в кэше, в запрос не попадают. Если ответ не удалось
+        разобрать целиком, недостающие тексты классифицируются по одному.
+        
+        Returns:
+            Результаты в порядке texts
+        """
+        if category_set is None:
+            category_set = frozenset(categories)
+        # Категории сериализуются для ключей кэша один раз, а не на каждый текст
+        if cache_context is None and self.cache_enabled:
+            cache_context = self._cache_context(categories, descriptions)
+        
+        results: List[Optional[Dict[str, any]]] = [None] * len(texts)
+        misses = []  # (индекс, ключ кэша, семантический кэш)
+        for i, text in enumerate(texts):
+            cached, cache_key, semantic_cache = self._lookup_caches(
+                text, categories, descriptions,
+                embeddings[i] if embeddings is not None else None,
+                cache_context
+            )
+            if cached is not None:
+                results[i] = cached
+            else:
+                misses.append((i, cache_key, semantic_cache))
+        
+        parsed = {}
+        if len(misses) > 1:
+            prompt = self._create_batch_prompt(
+                [texts[i] for i, _, _ in misses], categories, descriptions
+            )
+            response = await self._complete(
+                prompt, max_tokens=self.max_tokens_per_text * len(misses), limiter=limiter
+            )
+            parsed = self._parse_batch_result(response)
+        
+        for item_id, (i, cache_key, semantic_cache) in enumerate(misses, 1):
+            embedding = embeddings[i] if embeddings is not None else None
+            if item_id in parsed:
+                results[i] = self._build_result(
+                    texts[i], categories, parsed[item_id],
+                    cache_key, semantic_cache, embedding, category_set
+                )
+            else:
+                # Одиночный текст или текст, пропавший из пакетного ответа
+                results[i] = await self._classify_uncached(
+                    texts[i], categories, descriptions, cache_key, semantic_cache,
+                    embedding, category_set, limiter
+                )
+        
+        return results
+    
+    @staticmethod
+    def _read_checkpoint(path: str) -> Dict[str, Dict[str, any]]:
+        """Читает JSONL-чекпоинт: {текст: результат}. Битые строки (обрыв записи) пропускаются."""
+        restored = {}
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    row = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    continue
+                text = row.pop("text", None)
+                if text is not None:
+                    restored[text] = row
+        return restored
     
-    def classify_batch(
+    def classify_batch(self, *args, **kwargs) -> pd.DataFrame:
+        """
+        Синхронная обёртка над aclassify_batch для кода вне event loop
+        (скрипты, ноутбуки). Внутри бота используйте await aclassify_batch.
+        """
+        async def run():
+            try:
+                return await self.aclassify_batch(*args, **kwargs)
+            finally:
+                # Клиент привязан к event loop, который asyncio.run закроет
+                await self.aclose()
+        
+        return asyncio.run(run())
+    
+    async def aclassify_batch(
         self,
         texts: List[str],
         categories: List[str],
         descriptions: Dict[str, str] = None,
-        batch_delay: float = 1.0,
-        progress_callback=None
+        batch_delay: float = 0.125,
+        max_concurrency: int = 8,
+        initial_concurrency: int = 4,
+        progress_callback=None,
+        texts_per_request: Optional[int] = None,
+        output_jsonl: Optional[str] = None,
+        rules: Optional[List[Tuple[Union[str, re.Pattern], str, float]]] = None
     ) -> pd.DataFrame:
         """
         Классифицирует батч текстов.
         
+        Запросы к API выполняются параллельно: начиная с initial_concurrency
+        одновременных запросов, лимит растёт до max_concurrency, пока API не
+        отвечает 429, и снижается вдвое на каждый 429. Новые запросы стартуют
+        не чаще одного раза в batch_delay секунд.
+        Дубликаты и слишком короткие тексты в модель не отправляются.
+        
         Args:
             texts: Список текстов
             categories: Список категорий
             descriptions: Опциональные описания категорий
-            batch_delay: Задержка между запросами (сек)
-            progress_callback: Функция для обновления прогресса
+            batch_delay: Минимальный интервал между запросами (сек)
+            max_concurrency: Максимум одновременных запросов к API
+            initial_concurrency: Стартовый лимит одновременных запросов
+            progress_callback: Функция или корутина для обновления прогресса
+            texts_per_request: Сколько текстов отправлять в одном запросе
+                (по умолчанию TEXTS_PER_REQUEST, 1 — без упаковки)
+            output_jsonl: Файл-чекпоинт: ответы модели дописываются в него по мере
+                готовности, а при повторном запуске с тем же файлом уже размеченные
+                тексты пропускаются. Файл относится к одному набору категорий
+            rules: Дополнительные правила (шаблон, категория, уверенность) только
+                для этого батча; проверяются после правил из add_rule
             
         Returns:
             DataFrame с результатами классификации
         """
-        results = []
+        n_texts = len(texts)
+        logger.info(f"Начинаем классификацию {n_texts} текстов по {len(categories)} категориям")
         
-        logger.info(f"Начинаем классификацию {len(texts)} текстов по {len(categories)} категориям")
+        # Одинаковые тексты классифицируем один раз, результат раздаём всем копиям
+        by_text: Dict[str, Dict[str, any]] = {}
+        pending: List[str] = []
+        for text in dict.fromkeys(texts):
+            stripped = text.strip()
+            if len(stripped) < self.MIN_TEXT_LENGTH or stripped.isdigit():
+                # Классифицировать нечего — без запроса к модели
+                by_text[text] = {
+                    "category": UNDEFINED_CATEGORY,
+                    "confidence": 1.0,
+                    "reasoning": "Текст слишком короткий"
+                }
+            else:
+                pending.append(text)
         
-        for i, text in enumerate(tqdm(texts, desc="Классификация")):
-            try:
-                result = self.classify_text(text, categories, descriptions)
-                results.append({
-                    "text": text,
-                    "category": result["category"],
-                    "confidence": result["confidence"],
-                    "reasoning": result["reasoning"]
-                })
-                
-                if progress_callback:
-                    progress = (i + 1) / len(texts) * 100
-                    progress_callback(progress, i + 1, len(texts))
-                
-                # Задержка между запросами для соблюдения rate limits
-                if i < len(texts) - 1:
-                    time.sleep(batch_delay)
-                    
-            except Exception as e:
-                logger.error(f"Ошибка при классификации текста {i}: {e}")
-                results.append({
-                    "text": text,
-                    "category": categories[0],  # Fallback на первую категорию
-                    "confidence": 0.0,
-                    "reasoning": f"Ошибка: {str(e)}"
-                })
+        # Продолжение прерванного запуска: берём уже сохранённые ответы
+        if output_jsonl and pending and os.path.exists(output_jsonl):
+            restored = self._read_checkpoint(output_jsonl)
+            if restored:
+                pending = [text for text in pending if text not in restored]
+                by_text.update(restored)
+                logger.info(f"📂 Из чекпоинта восстановлено {len(restored)} текстов")
+        
+        category_set = frozenset(categories)
+        
+        # Детерминированные правила — до любых моделей
+        batch_rules = self._rules + [self._compile_rule(*rule) for rule in rules or []]
+        if batch_rules and pending:
+            remaining = []
+            for text in pending:
+                ruled = self._match_rules(text, category_set, batch_rules)
+                if ruled is not None:
+                    by_text[text] = ruled
+                else:
+                    remaining.append(text)
+            pending = remaining
+        
+        # Дешёвая локальная модель первой: в LLM уходят только неуверенные тексты
+        if self.zero_shot_model and pending:
+            local_results = await asyncio.to_thread(self._zero_shot_classify, pending, categories)
+            remaining = []
+            for text, local in zip(pending, local_results):
+                if local is not None:
+                    by_text[text] = local
+                    self.zero_shot_hits += 1
+                else:
+                    remaining.append(text)
+            pending = remaining
+        
+        n_pending = len(pending)
+        if n_pending < n_texts:
+            logger.info(
+                f"К модели уйдёт {n_pending} текстов "
+                f"(дубликаты, слишком короткие, найденные правилами и уверенно "
+                f"размеченные локально пропущены)"
+            )
+        
+        # Тексты близкой длины попадают в один запрос: промпты пакетов однороднее,
+        # один длинный текст не раздувает пакет из коротких. Результаты собираются
+        # по тексту, так что порядок строк на выходе не меняется
+        pending.sort(key=len)
+        
+        # Эмбеддинги для семантического кэша — одним батчем на весь список
+        embeddings = await asyncio.to_thread(self._encode_texts, pending) if pending else None
+        
+        cache_context = self._cache_context(categories, descriptions)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        limiter = AdaptiveLimiter(batch_delay, initial_concurrency, max_concurrency)
+        # Прогресс-бар только в интерактивном терминале, с редкой перерисовкой
+        progress_bar = tqdm(
+            total=n_pending,
+            desc="Классификация",
+            mininterval=0.5,
+            miniters=max(1, n_pending // 200),
+            smoothing=0,
+            disable=not (sys.stderr.isatty() and logger.isEnabledFor(logging.INFO))
+        )
+        completed = 0
+        # Колбэк прогресса — не чаще раза на процент выполнения
+        callback_step = max(1, n_pending // 100)
+        next_callback_at = callback_step
+        
+        async def classify_group(start: int, group: List[str]):
+            nonlocal completed, next_callback_at
+            async with semaphore:
+                try:
+                    group_results = await self.classify_texts(
+                        group, categories, descriptions,
+                        embeddings=embeddings[start:start + len(group)] if embeddings is not None else None,
+                        category_set=category_set,
+                        limiter=limiter,
+                        cache_context=cache_context
+                    )
+                    for text, result in zip(group, group_results):
+                        by_text[text] = {
+                            "category": result["category"],
+                            "confidence": result["confidence"],
+                            "reasoning": result["reasoning"]
+                        }
+                    if checkpoint is not None:
+                        checkpoint.write(b"".join(
+                            orjson.dumps({"text": text, **by_text[text]}) + b"\n"
+                            for text in group
+                        ))
+                        checkpoint.flush()
+                except Exception as e:
+                    logger.error("Ошибка при классификации текстов %d-%d: %s", start, start + len(group) - 1, e)
+                    for text in group:
+                        by_text[text] = {
+                            "category": categories[0],  # Fallback на первую категорию
+                            "confidence": 0.0,
+                            "reasoning": f"Ошибка: {str(e)}"
+                        }
+            
+            completed += len(group)
+            progress_bar.update(len(group))
+            if progress_callback and (completed >= next_callback_at or completed == n_pending):
+                next_callback_at = completed + callback_step
+                progress = completed / n_pending * 100
+                callback_result = progress_callback(progress, completed, n_pending)
+                if inspect.isawaitable(callback_result):
+                    await callback_result
+        
+        # Ошибочные (fallback) ответы в чекпоинт не пишутся — при повторе их спросят снова
+        checkpoint = None
+        if output_jsonl and pending:
+            checkpoint = open(output_jsonl, "ab")
+            if checkpoint.tell() > 0:
+                # Прошлый запуск мог оборваться посреди строки
+                checkpoint.write(b"\n")
+        group_size = texts_per_request or self.TEXTS_PER_REQUEST
+        try:
+            await asyncio.gather(*(
+                classify_group(start, pending[start:start + group_size])
+                for start in range(0, n_pending, group_size)
+            ))
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+            progress_bar.close()
+        
+        await asyncio.to_thread(self.save_caches)
+        
+        # Порядок строк совпадает с входным
+        results = [{"text": text, **by_text[text]} for text in texts]
         
         df = pd.DataFrame(results)
+        # Компактные типы: категория — коды + общий словарь, уверенность — float32
+        df['category'] = category_column(df['category'], categories)
+        df['confidence'] = df['confidence'].astype('float32')
         
         # Добавляем статистику
+        if self.cache_enabled:
+            logger.info(
+                f"Кэш ответов: {self.cache_hits} попаданий, {self.cache_misses} промахов, "
+                f"семантических попаданий: {self.semantic_hits}, "
+                f"из постоянного кэша: {self.disk_hits}"
+            )
+        if batch_rules:
+            logger.info(f"Правила: {self.rule_hits} текстов без запроса к моделям")
+        if self.zero_shot_model:
+            logger.info(f"Zero-shot модель: {self.zero_shot_hits} текстов без запроса к LLM")
+        logger.info(f"Лимит одновременных запросов к концу батча: {int(limiter.limit)}")
         logger.info(f"Классификация завершена. Распределение по категориям:")
+        counts = df['category'].value_counts(sort=False)
         for category in categories:
-            count = len(df[df['category'] == category])
+            count = int(counts.get(category, 0))
             percentage = count / len(df) * 100
             logger.info(f"  {category}: {count} ({percentage:.1f}%)")
         
@@ -265,31 +1552,42 @@ class LLMClassifier:
     def get_classification_stats(self, df: pd.DataFrame) -> Dict[str, any]:
         """Получает статистику по результатам классификации."""
         
+        confidence = confidence_as_float64(df['confidence'])
+        
+        # Один проход по данным: количество и средняя уверенность на категорию
+        grouped = confidence.groupby(df['category'], sort=False, observed=True).agg(['count', 'mean'])
+        
         # Считаем случаи когда модель не определила
-        undefined_count = len(df[df['category'] == "⚠️ Не удалось определить"])
+        undefined_count = int(grouped['count'].get(UNDEFINED_CATEGORY, 0))
         
         stats = {
             "total_texts": len(df),
             "undefined_count": undefined_count,  # НОВОЕ ПОЛЕ
             "undefined_percentage": (undefined_count / len(df) * 100) if len(df) > 0 else 0,
             "categories": {},
-            "avg_confidence": float(df['confidence'].mean()),
-            "min_confidence": float(df['confidence'].min()),
-            "max_confidence": float(df['confidence'].max())
+            "avg_confidence": float(confidence.mean()),
+            "min_confidence": float(confidence.min()),
+            "max_confidence": float(confidence.max())
         }
         
         # Статистика по категориям
-        for category in df['category'].unique():
-            category_df = df[df['category'] == category]
+        for category, count, mean in grouped.itertuples():
             stats["categories"][category] = {
-                "count": len(category_df),
-                "percentage": len(category_df) / len(df) * 100,
-                "avg_confidence": float(category_df['confidence'].mean())
+                "count": int(count),
+                "percentage": count / len(df) * 100,
+                "avg_confidence": float(mean)
             }
         
         return stats
 
 
+# Построчные разделители списка категорий и запасной разделитель — запятая
+CATEGORY_LINE_SPLIT_PATTERN = re.compile(r'[\n;]')
+CATEGORY_COMMA_SPLIT_PATTERN = re.compile(r',')
+# Нумерация списков в начале ("1. ", "2) ", "- ") и висячие запятые в конце
+CATEGORY_STRIP_PATTERN = re.compile(r'^[\d.\-)\s]+|[\s,]+$')
+
+
 def validate_categories(categories: List[str]) -> Tuple[bool, str]:
     """
     Валидирует список категорий.
@@ -334,21 +1632,19 @@ def parse_categories_from_text(text: str) -> List[str]:
     Returns:
         Список категорий
     """
-    # Пробуем разные разделители
-    if '\n' in text:
-        categories = text.split('\n')
-    elif ';' in text:
-        categories = text.split(';')
-    elif ',' in text:
-        categories = text.split(',')
+    # Перевод строки и точка с запятой делят список вместе ("a\nb; c"),
+    # запятые внутри таких строк остаются частью названия категории
+    if '\n' in text or ';' in text:
+        parts = CATEGORY_LINE_SPLIT_PATTERN.split(text)
     else:
-        categories = [text]
+        parts = CATEGORY_COMMA_SPLIT_PATTERN.split(text)
     
-    # Очистка и фильтрация
+    # Номера списков убираем только в начале, чтобы не срезать цифры
+    # в конце названия ("Тариф 2")
     categories = [
-        cat.strip().strip('0123456789.-) ')  # Убираем номера списков
-        for cat in categories
-        if cat.strip()
+        cat
+        for part in parts
+        if (cat := CATEGORY_STRIP_PATTERN.sub('', part))
     ]
     
     return categories
@@ -3,11 +3,12 @@
 Автоматический подбор параметров кластеризации
 """
 
+from bisect import bisect_right
 from dataclasses import dataclass
 from typing import Tuple
 
 
-@dataclass
+@dataclass(frozen=True)
 class ClusteringParams:
     """Параметры для HDBSCAN и UMAP"""
     min_cluster_size: int
@@ -17,6 +18,29 @@ class ClusteringParams:
     description: str = ""
 
 
+# Базовые параметры по размеру датасета: BASE_PARAMS[i] действует при
+# n_texts < BASE_PARAMS_UPPER_BOUNDS[i], последний элемент — для всех больших.
+# Экземпляры общие для всех вызовов, поэтому ClusteringParams неизменяемый
+BASE_PARAMS_UPPER_BOUNDS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+# Поля: min_cluster_size, min_samples, n_neighbors, n_components, description
+BASE_PARAMS = (
+    ClusteringParams(3, 1, 5, 5, "Очень маленький датасет (< 50)"),
+    ClusteringParams(4, 2, 8, 7, "Маленький датасет (50-100)"),
+    ClusteringParams(5, 2, 10, 8, "Малый датасет (100-250)"),
+    ClusteringParams(7, 3, 15, 10, "Средне-малый датасет (250-500)"),
+    ClusteringParams(10, 3, 20, 10, "Средний датасет (500-1K)"),
+    ClusteringParams(15, 4, 25, 10, "Средне-большой датасет (1K-2.5K)"),
+    ClusteringParams(20, 5, 30, 12, "Большой датасет (2.5K-5K)"),
+    ClusteringParams(30, 7, 40, 12, "Очень большой датасет (5K-10K)"),
+    ClusteringParams(45, 10, 55, 12, "Огромный датасет (10K-30K)"),
+    ClusteringParams(60, 15, 70, 15, "Массивный датасет (30K+)"),
+)
+
+# Ожидаемое число кластеров (min, max) по тем же правилам
+N_CLUSTERS_UPPER_BOUNDS = (100, 500, 2000, 10000)
+N_CLUSTERS_RANGES = ((2, 8), (5, 20), (10, 50), (20, 100), (30, 200))
+
+
 def get_clustering_params(n_texts: int, embedding_dim: int = 384) -> ClusteringParams:
     """
     Подбирает оптимальные параметры в зависимости от размера датасета
@@ -43,95 +67,7 @@ def get_clustering_params(n_texts: int, embedding_dim: int = 384) -> ClusteringP
     component_multiplier = max(0.8, min(1.5, dim_factor))
     
     # === БАЗОВЫЕ ПАРАМЕТРЫ ПО РАЗМЕРУ ДАТАСЕТА ===
-    if n_texts < 50:
-        base_params = ClusteringParams(
-            min_cluster_size=3,
-            min_samples=1,
-            n_neighbors=5,
-            n_components=5,
-            description="Очень маленький датасет (< 50)"
-        )
-    
-    elif n_texts < 100:
-        base_params = ClusteringParams(
-            min_cluster_size=4,
-            min_samples=2,
-            n_neighbors=8,
-            n_components=7,
-            description="Маленький датасет (50-100)"
-        )
-    
-    elif n_texts < 250:
-        base_params = ClusteringParams(
-            min_cluster_size=5,
-            min_samples=2,
-            n_neighbors=10,
-            n_components=8,
-            description="Малый датасет (100-250)"
-        )
-    
-    elif n_texts < 500:
-        base_params = ClusteringParams(
-            min_cluster_size=7,
-            min_samples=3,
-            n_neighbors=15,
-            n_components=10,
-            description="Средне-малый датасет (250-500)"
-        )
-    
-    elif n_texts < 1000:
-        base_params = ClusteringParams(
-            min_cluster_size=10,
-            min_samples=3,
-            n_neighbors=20,
-            n_components=10,
-            description="Средний датасет (500-1K)"
-        )
-    
-    elif n_texts < 2500:
-        base_params = ClusteringParams(
-            min_cluster_size=15,
-            min_samples=4,
-            n_neighbors=25,
-            n_components=10,
-            description="Средне-большой датасет (1K-2.5K)"
-        )
-    
-    elif n_texts < 5000:
-        base_params = ClusteringParams(
-            min_cluster_size=20,
-            min_samples=5,
-            n_neighbors=30,
-            n_components=12,
-            description="Большой датасет (2.5K-5K)"
-        )
-    
-    elif n_texts < 10000:
-        base_params = ClusteringParams(
-            min_cluster_size=30,
-            min_samples=7,
-            n_neighbors=40,
-            n_components=12,
-            description="Очень большой датасет (5K-10K)"
-        )
-    
-    elif n_texts < 30000:
-        base_params = ClusteringParams(
-            min_cluster_size=45,
-            min_samples=10,
-            n_neighbors=55,
-            n_components=12,
-            description="Огромный датасет (10K-30K)"
-        )
-    
-    else:  # >= 30000
-        base_params = ClusteringParams(
-            min_cluster_size=60,
-            min_samples=15,
-            n_neighbors=70,
-            n_components=15,
-            description="Массивный датасет (30K+)"
-        )
+    base_params = BASE_PARAMS[bisect_right(BASE_PARAMS_UPPER_BOUNDS, n_texts)]
     
     # === ПРИМЕНЯЕМ КОРРЕКЦИЮ ===
     adjusted_params = ClusteringParams(
@@ -152,13 +88,4 @@ def estimate_n_clusters(n_texts: int) -> Tuple[int, int]:
     Returns:
         (min_expected, max_expected)
     """
-    if n_texts < 100:
-        return (2, 8)
-    elif n_texts < 500:
-        return (5, 20)
-    elif n_texts < 2000:
-        return (10, 50)
-    elif n_texts < 10000:
-        return (20, 100)
-    else:
-        return (30, 200)
+    return N_CLUSTERS_RANGES[bisect_right(N_CLUSTERS_UPPER_BOUNDS, n_texts)]
@@ -1,45 +1,37 @@
 # clustering.py
-import inspect
-import collections
-
-# --- Совместимость с Python 3.11+ ---
-if not hasattr(inspect, 'getargspec'):
-    from collections import namedtuple
-    ArgSpec = namedtuple('ArgSpec', 'args varargs keywords defaults')
-    def getargspec(func):
-        spec = inspect.getfullargspec(func)
-        return ArgSpec(spec.args, spec.varargs, spec.varkw, spec.defaults)
-    inspect.getargspec = getargspec
-# ------------------------------------
-
 import pandas as pd
 import numpy as np
 import re
 import warnings
 import asyncio
-from collections import Counter
+import time
 from bertopic import BERTopic
-from sentence_transformers import SentenceTransformer
 from umap import UMAP
 from hdbscan import HDBSCAN
 from sklearn.feature_extraction.text import CountVectorizer  # +++
-import pymorphy2
 import os
 import requests
 import json
 from dotenv import load_dotenv
 from metrics import ClusteringMetrics
 from hierarchical_clustering import create_hierarchy, generate_master_category_names
-from config import EMBEDDING_MODEL
+from config import EMBEDDING_MODEL, UMAP_RANDOM_STATE
+from embeddings import encode_texts, get_embedding_model
 from cluster_params import get_clustering_params, estimate_n_clusters  # type: ignore
+from preprocessing import (
+    DOMAIN_STOP_WORDS, HTML_STOP_WORDS, STOP_WORDS, preprocess_texts
+)
 import logging
 
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-morph = pymorphy2.MorphAnalyzer()
-
 #YandexGPT Integration
 YANDEX_API_KEY = os.getenv('YANDEX_API_KEY')
 YANDEX_FOLDER_ID = os.getenv('YANDEX_FOLDER_ID')
@@ -188,7 +180,6 @@ def generate_cluster_name_yandex(texts_sample, max_retries=2):
             
             elif response.status_code == 429: 
                 print(f"⚠️ Rate limit, ждём 2 секунды...")
-                import time
                 time.sleep(2)
                 continue
             
@@ -199,7 +190,6 @@ def generate_cluster_name_yandex(texts_sample, max_retries=2):
         except requests.exceptions.Timeout:
             print(f"⚠️ YandexGPT timeout (попытка {attempt + 1}/{max_retries})")
             if attempt < max_retries - 1:
-                import time
                 time.sleep(1)
             continue
             
@@ -210,180 +200,13 @@ def generate_cluster_name_yandex(texts_sample, max_retries=2):
     return None
 
 
-# Cписок стоп-слов
-HTML_STOP_WORDS = {
-    'style', 'div', 'width', 'height', 'br', 'span', 'class', 'id', 'href', 'src',
-    'px', 'pt', 'em', 'rem', 'color', 'background', 'font', 'size', 'border',
-    'margin', 'padding', 'align', 'valign', 'center', 'left', 'right', 'justify',
-    'table', 'tr', 'td', 'th', 'tbody', 'thead', 'colspan', 'rowspan', 'target',
-    'rel', 'nofollow', 'blank', 'www', 'com', 'org', 'net', 'ru', 'quot', 'strong',
-    'bold', 'italic', 'underline', 'block', 'inline', 'none', 'hidden', 'visible',
-    'display', 'position', 'float', 'clear', 'overflow', 'zindex', 'opacity',
-    'img', 'alt', 'title', 'css', 'html', 'body', 'head', 'meta', 'link',
-    'ffffff', 'cellspacing', 'cellpadding', 'helvetica', 'arial', 'verdana',
-    'usedesk', 'normal', 'variant', 'rgb', 'rgba', 'sans', 'serif', 'blockquote',
-    'white', 'space', 'pre', 'wrap', 'text', 'family', 'line', 'height',
-    'amp', 'comment_id', 'answer', 'email', 'mailto', 'http', 'https',
-    'yandex', 'practicum', 'mail', 'support', 'usedesk', 'ticket', 'weight', 'start transform',
-    '255', '000', '111', '222', '333', '444', '555', '666', '777', '888', '999',
-}
-
-COMMON_RUSSIAN_STOP_WORDS = {
-    'добрый', 'здравствуйте', 'день', 'здравствуй', 'привет', 'спасибо', 'пожалуйста',
-    'уважаемый', 'можно', 'нужно', 'хочу', 'могу', 'есть', 'нет', 'да', 'не', 'на', 
-    'в', 'и', 'с', 'у', 'о', 'по', 'за', 'от', 'из', 'к', 'до', 'для', 'или', 'но',
-    'что', 'как', 'это', 'так', 'вот', 'же', 'ли', 'бы', 'то', 'во', 'со', 'изо',
-    'меня', 'тебя', 'его', 'её', 'нас', 'вас', 'их', 'мой', 'твой', 'свой', 'наш',
-    'ваш', 'ихний', 'кто', 'чего', 'чем', 'кому', 'чему', 'кого', 'ещё', 'уже',
-    'очень', 'более', 'самый', 'такой', 'весь', 'который', 'какой', 'тут', 'тот',
-    'будет', 'было', 'были', 'буду', 'будем', 'будете', 'будут',
-}
-
-DOMAIN_STOP_WORDS = {
-    # Техническое
-    'usedesk', 'ticket', 'comment', 'answer', 'email', 'support', 'mail', 'mailto',
-    'yandex', 'practicum', 'практикум', 'яндекс', 'практикума',
-    
-    # Email
-    'sent', 'iphone', 'ipad', 'android', 'отправлено', 'from', 'gmail',
-    'почта', 'почту', 'письмо', 'письма',
-    
-    # Даты
-    'января', 'февраля', 'марта', 'апреля', 'мая', 'июня',
-    'июля', 'августа', 'сентября', 'октября', 'ноября', 'декабря',
-    'понедельник', 'вторник', 'среда', 'четверг', 'пятница', 'суббота', 'воскресенье',
-    'сегодня', 'вчера', 'завтра',
-    
-    # HTML/CSS (расширенный список!)
-    'content', 'noreferrer', 'noopener', 'secure', 'nps', 'important', 'nbsp',
-    'bgcolor', 'radius', 'display', 'block', 'inline', 'hidden', 'visible',
-    'opacity', 'overflow', 'target', 'blank', 'rel', 'href', 'src', 'alt',
-    'title', 'class', 'style', 'font', 'margin', 'padding', 'border',
-    'width', 'height', 'px', 'caps', 'start', 'word', 'decoration', 'break', 'transparent', 'inbound', 'blank',
-    'transform', 'lesson', 'max', 'min', 'px',
-    
-    # UTM и аналитика
-    'utm_source', 'utm_medium', 'utm_campaign', 'utm_content', 'utm_term',
-    
-    # Общие фразы
-    'мне', 'меня', 'вам', 'вас', 'нас', 'тебя', 'его', 'её',
-    'можно', 'нужно', 'хочу', 'могу', 'хотел', 'хотела', 'надо',
-    'сейчас', 'теперь', 'уже', 'ещё', 'вопрос', 'помочь', 'помогите',
-    'доброе', 'утро', 'вечер', 'ночь',  # "доброе утро • утро • доброе"
-
-    # Числа и коды
-    '2025', '2024', '00', '07', '06', '01', '02', '03', '04', '05', '08', '09', '10', '11', '12',
-    '540px', '15', '20', '30',
-
-    # Служебные
-    'message', 'сумму', 'чек',  # "message • 00 сумму"
-}
-
-STOP_WORDS = COMMON_RUSSIAN_STOP_WORDS.union(HTML_STOP_WORDS).union(DOMAIN_STOP_WORDS)
-
-morph = pymorphy2.MorphAnalyzer()
-
-def clean_html(text: str) -> str:
-    """Агрессивная очистка HTML и CSS"""
-    if not isinstance(text, str):
-        return ""
-    
-    # 1. Удаляем email-подписи и шаблоны
-    email_patterns = [
-        r'Отправлено с (iPhone|iPad|Android|мобильн\w+)',
-        r'Sent from (my )?iPhone',
-        r'--\s*Отправлено из.*?Почты',
-        r'Служба образовательной поддержки.*',
-        r'T_I_C_K_E_T_I_D_\d+',
-        r'U_D_I_D_\d+',
-        r'Оцените.*нашу поддержку:.*',
-        r'Это письмо содержит ответы на опрос.*',
-        r'Яндекс не несёт ответственности.*',
-    ]
-    for pattern in email_patterns:
-        text = re.sub(pattern, ' ', text, flags=re.IGNORECASE | re.DOTALL)
-    
-    # 2. HTML-теги и entities
-    text = re.sub(r'<[^>]+>', ' ', text)
-    text = re.sub(r'&[a-z]+;', ' ', text)
-    text = re.sub(r'&#\d+;', ' ', text)
-    
-    # 3. CSS-стили (усиленная версия)
-    text = re.sub(r'[a-z\-]+\s*:\s*[^;"]+;?', ' ', text, flags=re.IGNORECASE)
-    text = re.sub(r'\w+\s*=\s*["\'][^"\']*["\']', ' ', text)
-    text = re.sub(r'\b\d+[a-z%]+\b', ' ', text, flags=re.IGNORECASE)
-    text = re.sub(r'#[0-9a-f]{3,6}\b', ' ', text, flags=re.IGNORECASE)
-    
-    # 4. Удаляем HTML/CSS слова-мусор
-    html_junk = [
-        r'\bcontent\b', r'\bnoreferrer\b', r'\bnoopener\b', r'\bsecure\b',
-        r'\bnps\b', r'\bimportant\b', r'\bnbsp\b', r'\bbgcolor\b',
-        r'\bradius\b', r'\bdisplay\b', r'\bblock\b', r'\binline\b',
-        r'\bhidden\b', r'\bvisible\b', r'\bopacity\b', r'\boverflow\b',
-        r'\btarget\b', r'\bblank\b', r'\brel\b', r'\bhref\b', r'\bsrc\b',
-        r'\balt\b', r'\btitle\b', r'\bclass\b', r'\bid\b',
-    ]
-    for pattern in html_junk:
-        text = re.sub(pattern, ' ', text, flags=re.IGNORECASE)
-    
-    # 5. Удаляем повторяющиеся числа и CSS-слова
-    text = re.sub(r'\b(\d+)\s+\1\b', '', text) 
-    text = re.sub(r'\b\d+px\b', '', text, flags=re.I)
-    text = re.sub(r'\bcaps\b', '', text, flags=re.I)
-    text = re.sub(r'\bstart\b', '', text, flags=re.I)
-    
-    # 6. Удаляем подчёркивания (из форм)
-    text = re.sub(r'_{3,}', ' ', text) 
-    text = re.sub(r'_+', ' ', text)     
-    
-    # 7. Удаляем "Технические данные:"
-    text = re.sub(r'Технические данные:.*', '', text, flags=re.I)
-
-    # 8. Чистим пробелы
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    return text
-
-
-def preprocess_text(text: str) -> str:
-    """Улучшенная предобработка"""
-    if not isinstance(text, str) or not text.strip():
-        return ""
-    
-    text = clean_html(text)
-    text = text.lower()
-    text = re.sub(r'http\S+', '', text)
-    text = re.sub(r'[^\w\s]', ' ', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    words = []
-    for w in text.split():
-        # Расширенная фильтрация
-        if (len(w) > 2 and 
-            len(w) < 20 and 
-            w not in STOP_WORDS and
-            not w.isdigit() and
-            not re.match(r'^\d+$', w) and
-            not re.match(r'^\d+[a-z]+$', w, re.I) and 
-            not re.match(r'^[a-z]+\d+$', w, re.I) and
-            not any(bad in w for bad in ['amp', 'comment', 'answer', 'mailto'])):
-            
-            # Лемматизация только русских слов
-            if re.match(r'^[а-яё]+$', w):
-                parsed = morph.parse(w)[0]
-                w = parsed.normal_form
-            words.append(w)
-    
-    return ' '.join(words)
-
-def merge_similar_clusters(topics, topic_model, df, similarity_threshold=0.75):
+def merge_similar_clusters(topics, embeddings, similarity_threshold=0.75):
     """
     Объединяет семантически близкие кластеры
     
     Args:
         topics: массив cluster_id для каждого текста
-        topic_model: обученная BERTopic модель
-        df: датафрейм с текстами
+        embeddings: эмбеддинги текстов (те же, что ушли в BERTopic)
         similarity_threshold: порог схожести (0-1), выше = строже
     
     Returns:
@@ -393,41 +216,24 @@ def merge_similar_clusters(topics, topic_model, df, similarity_threshold=0.75):
     from sklearn.metrics.pairwise import cosine_similarity
     import numpy as np
     
-    # Получаем уникальные кластеры (без шума)
-    unique_clusters = [c for c in set(topics) if c != -1]
+    # Получаем уникальные кластеры (без шума) и номер кластера для каждой строки
+    topics_arr = np.asarray(topics)
+    in_cluster = topics_arr != -1
+    cluster_ids, row_cluster, cluster_sizes = np.unique(
+        topics_arr[in_cluster], return_inverse=True, return_counts=True
+    )
     
-    if len(unique_clusters) < 2:
+    if len(cluster_ids) < 2:
         return topics, {}
     
-    # Достаём оригинальную модель
-    # BERTopic оборачивает модель в Backend, нужно достать оригинал
-    embedding_model = topic_model.embedding_model
-    
-    # Проверяем, есть ли атрибут .embedding_model (если это Backend)
-    if hasattr(embedding_model, 'embedding_model'):
-        embedding_model = embedding_model.embedding_model
-    
-    # Получаем embeddings центров кластеров
-    cluster_centers = {}
-    
-    for cluster_id in unique_clusters:
-        cluster_indices = [i for i, c in enumerate(topics) if c == cluster_id]
-        if len(cluster_indices) == 0:
-            continue
-        
-        # Берём тексты кластера
-        cluster_texts = [df.iloc[i, 0] for i in cluster_indices[:20]]  # макс 20 для скорости
-        
-        # Получаем embeddings
-        embeddings = embedding_model.encode(cluster_texts)
-        
-        # Центр кластера = среднее embeddings
-        cluster_centers[cluster_id] = np.mean(embeddings, axis=0)
+    # Центры кластеров — из уже посчитанных эмбеддингов, без повторного
+    # кодирования: суммы по кластерам одним проходом, затем деление на размер
+    center_vectors = np.zeros((len(cluster_ids), embeddings.shape[1]), dtype=np.float64)
+    np.add.at(center_vectors, row_cluster, embeddings[in_cluster])
+    center_vectors /= cluster_sizes[:, None]
+    cluster_ids = cluster_ids.tolist()
     
     # Вычисляем матрицу схожести между кластерами
-    cluster_ids = list(cluster_centers.keys())
-    center_vectors = np.array([cluster_centers[cid] for cid in cluster_ids])
-    
     similarity_matrix = cosine_similarity(center_vectors)
     
     # Находим пары для объединения
@@ -454,10 +260,7 @@ def merge_similar_clusters(topics, topic_model, df, similarity_threshold=0.75):
     
     # Применяем объединение
     if merge_map:
-        topics_merged = topics.copy()
-        for i, cluster_id in enumerate(topics):
-            if cluster_id in merge_map:
-                topics_merged[i] = merge_map[cluster_id]
+        topics_merged = [merge_map.get(cluster_id, cluster_id) for cluster_id in topics]
         
         print(f"✅ Объединено {len(merge_map)} пар кластеров")
         return topics_merged, merge_map
@@ -467,24 +270,25 @@ def merge_similar_clusters(topics, topic_model, df, similarity_threshold=0.75):
 
 def calculate_metrics(topics, cluster_names, topic_model):
     """Расширенный расчет метрик с уникальными названиями кластеров"""
-    cluster_counts = Counter(topics)
-    noise_count = cluster_counts.get(-1, 0)
-    noise_percent = (noise_count / len(topics)) * 100 if len(topics) > 0 else 0
-    n_clusters = len([c for c in cluster_counts.keys() if c != -1])
-    cluster_sizes = [count for cluster, count in cluster_counts.items() if cluster != -1]
-    avg_size = np.mean(cluster_sizes) if cluster_sizes else 0
+    # Один проход np.unique вместо Counter + нескольких списков по topics
+    topics_arr = np.asarray(topics)
+    cluster_ids, first_index, counts = np.unique(topics_arr, return_index=True, return_counts=True)
+    noise_mask = cluster_ids == -1
+    noise_count = int(counts[noise_mask].sum())
+    noise_percent = (noise_count / len(topics_arr)) * 100 if len(topics_arr) > 0 else 0
+    cluster_sizes = counts[~noise_mask]
+    n_clusters = len(cluster_sizes)
+    avg_size = cluster_sizes.mean() if n_clusters else 0
     
     # Собираем топ кластеры с уникальными названиями
     top_clusters = []
     seen_names = set()
     
-    sorted_clusters = sorted(
-        [(cluster, count) for cluster, count in cluster_counts.items() if cluster != -1],
-        key=lambda x: x[1],
-        reverse=True
-    )
+    # По убыванию размера; при равенстве — в порядке первого появления
+    clusters = cluster_ids[~noise_mask]
+    order = np.lexsort((first_index[~noise_mask], -cluster_sizes))
     
-    for cluster_id, size in sorted_clusters:
+    for cluster_id, size in zip(clusters[order].tolist(), cluster_sizes[order].tolist()):
         name = cluster_names.get(cluster_id, f"Cluster {cluster_id}")
         
         # Пропускаем дублирующиеся названия
@@ -504,16 +308,113 @@ def calculate_metrics(topics, cluster_names, topic_model):
     return {
         'n_clusters': n_clusters,
         'noise_percent': round(noise_percent, 2),
-        'avg_cluster_size': round(avg_size, 2),
-        'total_texts': len(topics),
+        'avg_cluster_size': round(float(avg_size), 2),
+        'total_texts': len(topics_arr),
         'top_clusters': top_clusters,
-        'cluster_distribution': dict(cluster_counts)
+        'cluster_distribution': dict(zip(cluster_ids.tolist(), counts.tolist()))
     }
 
 
-def clusterize_texts(file_path: str, progress_callback=None):
-    """Кластеризация с оптимизированными параметрами"""
-    import time
+def parquet_path_for(csv_path: str) -> str:
+    """
+    Путь к parquet-копии результата (служебный кэш, пользователю не отправляется).
+    Меняется только расширение файла: путь без ".csv" не должен совпасть с самим CSV
+    """
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+
+def write_csv(df: pd.DataFrame, path: str) -> None:
+    """
+    Пишет CSV через C++-писатель Arrow (в разы быстрее pandas на строковых колонках).
+    Без pyarrow — обычный df.to_csv.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+    except ImportError:
+        df.to_csv(path, index=False, encoding='utf-8')
+        return
+    pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), path)
+
+
+def save_parquet_copy(df: pd.DataFrame, csv_path: str) -> None:
+    """
+    Сохраняет копию результата в Parquet рядом с CSV.
+    Бот читает её обратно для кэша — это в разы быстрее pd.read_csv.
+    Без pyarrow просто пропускаем: бот прочитает CSV.
+    """
+    try:
+        df.to_parquet(parquet_path_for(csv_path), index=False, compression='zstd')
+    except ImportError:
+        logger.debug("pyarrow не установлен, parquet-копия не создаётся")
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось сохранить parquet-копию: {e}")
+
+
+def umap_n_jobs() -> int:
+    """С фиксированным seed UMAP всё равно однопоточный, без него — все ядра"""
+    return 1 if UMAP_RANDOM_STATE is not None else -1
+
+
+# С этого числа текстов соседей для UMAP ищем через FAISS HNSW, а не pynndescent
+FAISS_KNN_MIN_TEXTS = 5000
+FAISS_HNSW_M = 32
+FAISS_HNSW_EF_CONSTRUCTION = 200
+FAISS_HNSW_EF_SEARCH = 128
+
+
+def faiss_cosine_knn(embeddings: np.ndarray, n_neighbors: int):
+    """
+    Приближённые ближайшие соседи по косинусу (HNSW на нормированных векторах)
+    в формате precomputed_knn для UMAP: (индексы, расстояния, поисковый индекс)
+    """
+    vectors = np.array(embeddings, dtype=np.float32, order='C')
+    faiss.normalize_L2(vectors)
+    index = faiss.IndexHNSWFlat(vectors.shape[1], FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+    index.add(vectors)
+    index.hnsw.efSearch = max(FAISS_HNSW_EF_SEARCH, n_neighbors)
+    similarities, indices = index.search(vectors, n_neighbors)
+    # Косинусное расстояние, как считает сам UMAP при metric='cosine'
+    distances = np.clip(1.0 - similarities, 0.0, None)
+    return indices.astype(np.int64), distances.astype(np.float32), None
+
+
+def warmup_umap(n_components: int = 5) -> None:
+    """
+    Прогрев UMAP на маленьком случайном наборе при старте бота:
+    numba компилирует функции layout'а заранее, а не на первом запросе пользователя.
+    """
+    try:
+        data = np.random.default_rng(0).random((64, 32), dtype=np.float32)
+        UMAP(
+            n_neighbors=5, n_components=n_components, metric='cosine',
+            random_state=UMAP_RANDOM_STATE, n_jobs=umap_n_jobs(), low_memory=False
+        ).fit(data)
+        logger.info("🔥 UMAP прогрет")
+    except Exception as e:
+        logger.warning(f"⚠️ Прогрев UMAP не удался: {e}")
+
+
+# Нормализация названий кластеров
+CLUSTER_NAME_QUOTES_PATTERN = re.compile(r'[«»"\'🔹•]')
+CLUSTER_NAME_DISALLOWED_PATTERN = re.compile(r'[^а-яёa-z0-9\s-]')  # Разрешаем дефис
+# Минимальные замены — только явные дубли
+CLUSTER_NAME_REPLACEMENTS = {
+    'дипломы': 'диплом',
+    'сертификаты': 'диплом',
+    'технические проблемы': 'технические ошибки',
+    'технические сбои': 'технические ошибки',
+}
+
+
+def clusterize_texts(file_path: str, progress_callback=None, event_loop=None):
+    """
+    Кластеризация с оптимизированными параметрами
+
+    При вызове из рабочего потока (asyncio.to_thread) event_loop — цикл бота:
+    сообщения о прогрессе отправляются в него потокобезопасно
+    """
     start_time = time.time()
 
     logger.info(f"🔄 Starting clustering | File: {file_path}")
@@ -526,14 +427,23 @@ def clusterize_texts(file_path: str, progress_callback=None):
             except:
                 pass
 
+    # Цикл событий определяем один раз, а не на каждое сообщение
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
     def sync_log(msg):
         try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                asyncio.create_task(log_progress(msg))
+            if event_loop is not None:
+                asyncio.run_coroutine_threadsafe(log_progress(msg), event_loop)
+            elif loop is not None:
+                loop.create_task(log_progress(msg))
+            elif progress_callback:
+                asyncio.run(log_progress(msg))
             else:
-                loop.run_until_complete(log_progress(msg))
-        except:
+                print(msg)
+        except Exception:
             print(msg)
 
     # Загрузка
@@ -549,12 +459,21 @@ def clusterize_texts(file_path: str, progress_callback=None):
 
     # Предобработка
     sync_log("🧹 Предобработка...")
-    preprocessed_texts = [preprocess_text(t) for t in raw_texts]
-    
-    valid_indices = [i for i, t in enumerate(preprocessed_texts) 
-                     if t.strip() and len(t.split()) >= 2]
-    
-    if len(valid_indices) <= 3:
+    # Одинаковые обращения обрабатываем один раз
+    distinct_texts = list(dict.fromkeys(raw_texts))
+    preprocessed_unique = dict(zip(distinct_texts, preprocess_texts(distinct_texts)))
+    
+    # Один проход по строкам: тексты короче двух слов отбрасываем, для каждого
+    # очищенного текста запоминаем первую строку (как drop_duplicates keep="first")
+    first_rows = {}
+    n_valid = 0
+    for i, t in enumerate(raw_texts):
+        cleaned = preprocessed_unique[t]
+        if ' ' in cleaned:
+            n_valid += 1
+            first_rows.setdefault(cleaned, i)
+    
+    if n_valid <= 3:
         df["cluster_id"] = 0
         df["cluster_name"] = "Все тексты"
         out = file_path.replace(".csv", "_clustered.csv")
@@ -562,36 +481,36 @@ def clusterize_texts(file_path: str, progress_callback=None):
         df.to_csv(out, index=False, encoding='utf-8')
         return out, {'n_clusters': 1, 'total_texts': n}
 
-    preprocessed_texts = [preprocessed_texts[i] for i in valid_indices]
-    df = df.iloc[valid_indices].reset_index(drop=True)
-    
     # Удаление дубликатов по очищенным текстам
     sync_log("🔍 Удаление дубликатов...")
-    df['_preprocessed'] = preprocessed_texts
-    df = df.drop_duplicates(subset='_preprocessed', keep="first").reset_index(drop=True)
-    preprocessed_texts = df['_preprocessed'].tolist()
-    df = df.drop(columns=['_preprocessed'])  # Убираем служебную колонку
+    df = df.iloc[list(first_rows.values())].reset_index(drop=True)
+    preprocessed_texts = list(first_rows)
+    # Промежуточные словари по всем строкам дальше не нужны — освобождаем до
+    # загрузки модели и UMAP, самых прожорливых по памяти этапов
+    del preprocessed_unique, first_rows, raw_texts, distinct_texts
     unique_texts = preprocessed_texts
     n_unique = len(unique_texts)
     sync_log(f"✨ Уникальных: {n_unique}")
 
     # Модель
     sync_log(f"🤖 Загрузка модели: {EMBEDDING_MODEL}...")
-    try:
-        model = SentenceTransformer(EMBEDDING_MODEL)
-    except Exception as e:
-        sync_log(f"⚠️ Ошибка загрузки {EMBEDDING_MODEL}, использую fallback")
-        model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
+    model = get_embedding_model()
 
     # Объединяем все стоп-слова для vectorizer
     ALL_STOP_WORDS = STOP_WORDS.union(DOMAIN_STOP_WORDS).union(HTML_STOP_WORDS)
 
+    # Тексты уже приведены к нижнему регистру и разбиты на слова в preprocess_text
+    # (только \w-символы, длина > 2) — повторная токенизация регуляркой не нужна,
+    # хватает str.split
     vectorizer_model = CountVectorizer(
         ngram_range=(1, 2),
         stop_words=list(ALL_STOP_WORDS), 
         min_df=1,        # Минимально возможное значение
         max_df=0.8,    
-        max_features=1800  
+        max_features=1800,
+        tokenizer=str.split,
+        token_pattern=None,
+        lowercase=False
     )
 
     print(f"📊 Параметры CountVectorizer: min_df=1, max_df=1.0 (безопасный режим)")
@@ -624,8 +543,9 @@ def clusterize_texts(file_path: str, progress_callback=None):
         n_components=n_components,
         min_dist=0.0,
         metric='cosine',
-        random_state=42,
-        n_jobs=1,
+        random_state=UMAP_RANDOM_STATE,
+        n_jobs=umap_n_jobs(),
+        low_memory=False,
         spread =1.0
     )
     
@@ -634,7 +554,10 @@ def clusterize_texts(file_path: str, progress_callback=None):
         min_samples=min_samples,
         metric='euclidean',
         cluster_selection_method='eom',
-        prediction_data=True
+        # После UMAP ≤ 20 измерений: Борувка по k-d дереву, ядра — все
+        algorithm='boruvka_kdtree',
+        core_dist_n_jobs=-1,
+        prediction_data=False  # transform() новых текстов не используется
     )
     
     topic_model = BERTopic(
@@ -680,19 +603,17 @@ def clusterize_texts(file_path: str, progress_callback=None):
     # Кластеризация
     sync_log(f"🎯 Кластеризация (min_size={min_cluster_size})...")
     try:
-        topics, _ = topic_model.fit_transform(unique_texts)
+        # Эмбеддинги считаем один раз: они же идут в метрики и иерархию
+        embeddings = encode_texts(model, unique_texts)
+        if faiss is not None and n_unique >= FAISS_KNN_MIN_TEXTS:
+            umap_model.precomputed_knn = faiss_cosine_knn(embeddings, n_neighbors)
+        topics, _ = topic_model.fit_transform(unique_texts, embeddings=embeddings)
     except Exception as e:
         sync_log(f"⚠️ Ошибка: {e}")
         raise
 
-    # Получаем эмбединги для метрик
     sync_log("📊 Вычисление метрик качества...")
-    embeddings = None
     try:
-        embeddings = topic_model._extract_embeddings(
-            unique_texts,
-            method="document"
-        )
         quality_metrics = ClusteringMetrics.calculate(embeddings, topics)
         sync_log(f"✅ Метрики: Silhouette={quality_metrics['silhouette_score']:.3f}, DB={quality_metrics['davies_bouldin_index']:.3f}")
     except Exception as e:
@@ -709,8 +630,7 @@ def clusterize_texts(file_path: str, progress_callback=None):
             sync_log("🔗 Объединение похожих кластеров...")
             topics, merge_map = merge_similar_clusters(
                 topics, 
-                topic_model, 
-                pd.DataFrame({0: unique_texts}),
+                embeddings, 
                 similarity_threshold=0.70
             )
 
@@ -731,11 +651,15 @@ def clusterize_texts(file_path: str, progress_callback=None):
     else:
         sync_log("📝 Генерация названий...")
 
-    info = topic_model.get_topic_info()
     cluster_names = {}
 
+    # Тексты по кластерам — одним проходом, а не сканом topics на каждый кластер
+    texts_by_cluster = {}
+    for text, cluster_id in zip(unique_texts, topics):
+        texts_by_cluster.setdefault(cluster_id, []).append(text)
+
     # Сначала генерируем названия для всех уникальных кластеров
-    unique_clusters = set(topics)  # Используем обновлённые topics!
+    unique_clusters = set(texts_by_cluster)  # Используем обновлённые topics!
     for cluster_id in unique_clusters:
         if cluster_id == -1:
             cluster_names[cluster_id] = "Прочее"
@@ -749,7 +673,7 @@ def clusterize_texts(file_path: str, progress_callback=None):
         # 1. Пробуем YandexGPT (если настроен)
         if YANDEX_API_KEY and YANDEX_FOLDER_ID:
             # Получаем тексты кластера
-            cluster_texts = [unique_texts[i] for i, cluster_id_enum in enumerate(topics) if cluster_id_enum == cluster_id]
+            cluster_texts = texts_by_cluster[cluster_id]
             
             if cluster_texts:
                 yandex_name = generate_cluster_name_yandex(cluster_texts)
@@ -773,7 +697,7 @@ def clusterize_texts(file_path: str, progress_callback=None):
 
     # Сохраняем базовую кластеризацию
     df["cluster_id"] = topics
-    df["cluster_name"] = [cluster_names.get(t, "Шум") for t in topics]
+    df["cluster_name"] = df["cluster_id"].map(cluster_names).fillna("Шум")
 
     # Создаём иерархии (мастер-категории)
     sync_log("🗂️ Создание иерархии категорий...")
@@ -850,30 +774,16 @@ def clusterize_texts(file_path: str, progress_callback=None):
     # ========================================
 
     # Нормализация названий кластеров
-    import re
-
     def normalize_cluster_name(name: str) -> str:
         """Лёгкая нормализация — только очевидные дубли"""
         if not isinstance(name, str):
             return ""
         
         name = name.lower().strip()
-        name = re.sub(r'[«»"\'🔹•]', '', name)
-        name = re.sub(r'[^а-яёa-z0-9\s-]', ' ', name)  # Разрешаем дефис
-        name = re.sub(r'\s+', ' ', name).strip()
-
-        # Минимальные замены — только явные дубли
-        replacements = {
-            'дипломы': 'диплом',
-            'сертификаты': 'диплом',
-            'технические проблемы': 'технические ошибки',
-            'технические сбои': 'технические ошибки',
-        }
-        
-        for old, new in replacements.items():
-            if name == old:  
-                name = new
-        
+        name = CLUSTER_NAME_QUOTES_PATTERN.sub('', name)
+        name = CLUSTER_NAME_DISALLOWED_PATTERN.sub(' ', name)
+        name = ' '.join(name.split())
+        name = CLUSTER_NAME_REPLACEMENTS.get(name, name)
         return name.title()
 
     df["cluster_name"] = df["cluster_name"].apply(normalize_cluster_name)
@@ -904,13 +814,6 @@ def clusterize_texts(file_path: str, progress_callback=None):
 
     df = df[column_order]
 
-    # Сохраняем
-    out = file_path.replace(".csv", "_clustered.csv")
-    df.to_csv(out, index=False, encoding='utf-8')
-
-    sync_log(f"💾 Результат сохранён: {out}")
-
-
     stats = calculate_metrics(topics, cluster_names, topic_model)
     
     # Добавляем метрики качества в stats
@@ -930,9 +833,11 @@ def clusterize_texts(file_path: str, progress_callback=None):
         for master_id, info in sorted_masters[:5]:  # Топ-5
             sync_log(f"   {info['name']}: {info['n_texts']} текстов ({info['n_subclusters']} подкатегорий)")
 
-    # Сохранение
+    # Сохранение (один раз — после того как собрана статистика)
     out = file_path.replace(".csv", "_clustered.csv")
-    df.to_csv(out, index=False, encoding='utf-8')
+    write_csv(df, out)
+    save_parquet_copy(df, out)
+    sync_log(f"💾 Результат сохранён: {out}")
 
     sync_log(f"✅ {stats['n_clusters']} кластеров за {time.time()-start_time:.1f}с")
     
@@ -5,11 +5,13 @@ from pathlib import Path
 # Пути
 BASE_DIR = Path(__file__).parent
 CACHE_DIR = BASE_DIR / "cache"
+CATEGORY_CACHE_DIR = CACHE_DIR / "categories"  # сгенерированные категории
 FONTS_DIR = BASE_DIR / "fonts"
 TEMP_DIR = Path("/tmp/clustering_bot")
 
 # Создаём директории
 CACHE_DIR.mkdir(exist_ok=True)
+CATEGORY_CACHE_DIR.mkdir(exist_ok=True)
 TEMP_DIR.mkdir(exist_ok=True)
 
 # Лимиты
@@ -33,5 +35,27 @@ EMBEDDING_MODEL = os.getenv(
     DEFAULT_EMBEDDING_MODEL
 )
 
+# Фиксированный seed UMAP делает кластеры воспроизводимыми, но UMAP тогда
+# работает в один поток. Пусто — многопоточный UMAP без seed
+UMAP_RANDOM_STATE = int(os.getenv("UMAP_RANDOM_STATE")) if os.getenv("UMAP_RANDOM_STATE") else None
+
+# Локальный zero-shot классификатор перед YandexGPT (пусто — отключён),
+# например MoritzLaurer/mDeBERTa-v3-base-xnli-multilingual-nli-2mil7
+ZERO_SHOT_MODEL = os.getenv("ZERO_SHOT_MODEL", "")
+ZERO_SHOT_THRESHOLD = float(os.getenv("ZERO_SHOT_THRESHOLD", "0.85"))
+
+# Семантический кэш классификатора: ответ для перефразированного текста берётся
+# у ближайшего уже классифицированного (косинус >= порога). Выключен по умолчанию:
+# близкие по эмбеддингу тексты могут различаться по смыслу ("не пришёл" / "пришёл")
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "").lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+
 # === Admin ===
 ADMIN_TELEGRAM_ID = os.getenv("ADMIN_TELEGRAM_ID")
+
+# === Webhook ===
+# Если задан WEBHOOK_URL (https://host), бот получает обновления через webhook
+# вместо long polling. TLS обеспечивает reverse proxy (nginx/Caddy).
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
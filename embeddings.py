@@ -0,0 +1,68 @@
+# embeddings.py
+"""
+Общая модель эмбеддингов для кластеризации и семантического кэша классификатора.
+
+sentence-transformers (и torch) импортируются только при первой загрузке модели,
+поэтому модуль можно импортировать, не загружая их.
+"""
+import logging
+import threading
+
+import numpy as np
+
+from config import DEFAULT_EMBEDDING_MODEL, EMBEDDING_MODEL
+
+logger = logging.getLogger(__name__)
+
+# На GPU батч крупнее; внутри батчей sentence-transformers сам сортирует тексты по длине
+ENCODE_BATCH_SIZE_GPU = 128
+ENCODE_BATCH_SIZE_CPU = 32
+
+
+def model_on_gpu(model: "SentenceTransformer") -> bool:
+    return model.device.type == 'cuda'
+
+
+# Модель эмбеддингов грузится один раз на процесс и переиспользуется всеми запросами
+_embedding_model = None
+_embedding_model_lock = threading.Lock()
+
+
+def get_embedding_model() -> "SentenceTransformer":
+    """
+    Общая модель эмбеддингов (EMBEDDING_MODEL, при ошибке загрузки — модель по умолчанию).
+    На GPU переводится в fp16.
+    """
+    global _embedding_model
+    if _embedding_model is not None:
+        return _embedding_model
+    with _embedding_model_lock:
+        if _embedding_model is None:
+            from sentence_transformers import SentenceTransformer
+            try:
+                model = SentenceTransformer(EMBEDDING_MODEL)
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка загрузки {EMBEDDING_MODEL}, использую fallback: {e}")
+                model = SentenceTransformer(DEFAULT_EMBEDDING_MODEL)
+            model.eval()
+            # SentenceTransformer сам выбирает CUDA, если она есть; там считаем в fp16
+            if model_on_gpu(model):
+                model.half()
+                logger.info("⚡ Эмбеддинги на GPU (fp16)")
+            _embedding_model = model
+    return _embedding_model
+
+
+def encode_texts(model: "SentenceTransformer", texts, normalize: bool = False) -> np.ndarray:
+    """Эмбеддинги текстов батчами (float32 независимо от точности модели)"""
+    batch_size = ENCODE_BATCH_SIZE_GPU if model_on_gpu(model) else ENCODE_BATCH_SIZE_CPU
+    return np.asarray(
+        model.encode(
+            texts,
+            batch_size=batch_size,
+            normalize_embeddings=normalize,
+            show_progress_bar=False,
+            convert_to_numpy=True
+        ),
+        dtype=np.float32
+    )
@@ -5,6 +5,7 @@
 
 import logging
 import html
+from collections import Counter
 from typing import Dict, List, Tuple
 import pandas as pd
 
@@ -29,7 +30,13 @@ def calculate_metrics(
         Словарь с метриками
     """
     n_total = len(y_true)
-    n_correct = sum(1 for t, p in zip(y_true, y_pred) if t == p)
+    
+    # Один проход по данным вместо трёх проходов на каждую категорию
+    true_counts = Counter(y_true)
+    pred_counts = Counter(y_pred)
+    correct_counts = Counter(t for t, p in zip(y_true, y_pred) if t == p)
+    
+    n_correct = sum(correct_counts.values())
     accuracy = n_correct / n_total if n_total > 0 else 0
     
     metrics = {
@@ -42,13 +49,13 @@ def calculate_metrics(
     # Метрики по каждой категории
     for category in categories:
         # True Positives: правильно предсказали эту категорию
-        tp = sum(1 for t, p in zip(y_true, y_pred) if t == category and p == category)
+        tp = correct_counts[category]
         
         # False Positives: неправильно предсказали эту категорию
-        fp = sum(1 for t, p in zip(y_true, y_pred) if t != category and p == category)
+        fp = pred_counts[category] - tp
         
         # False Negatives: пропустили эту категорию
-        fn = sum(1 for t, p in zip(y_true, y_pred) if t == category and p != category)
+        fn = true_counts[category] - tp
         
         # Precision, Recall, F1
         precision = tp / (tp + fp) if (tp + fp) > 0 else 0
@@ -0,0 +1,292 @@
+# preprocessing.py
+"""
+Очистка и нормализация текстов обращений перед кластеризацией.
+
+Модуль лёгкий (без моделей и BERTopic), чтобы процессы-воркеры
+параллельной предобработки импортировали только его.
+"""
+import re
+from functools import lru_cache
+from typing import List
+
+# Словари pymorphy (~15 МБ) загружаются при первой лемматизации: и в боте,
+# и в каждом процессе-воркере — один раз на процесс. Сам pymorphy тоже
+# импортируется лениво: очистке текста (clean_html и др.) он не нужен
+_morph = None
+
+
+def _import_pymorphy():
+    # pymorphy3 — поддерживаемый форк pymorphy2 с тем же API; с extra [fast]
+    # словари DAWG читает C-расширение, а не чистый Python (~в 10 раз быстрее).
+    # pymorphy2 остаётся запасным вариантом
+    try:
+        import pymorphy3 as pymorphy
+    except ImportError:
+        import inspect
+
+        # --- Совместимость с Python 3.11+ ---
+        # pymorphy2 0.9.1 вызывает inspect.getargspec, удалённый в 3.11
+        # (bertopic/umap/hdbscan в requirements.txt его уже не используют)
+        if not hasattr(inspect, 'getargspec'):
+            from collections import namedtuple
+            ArgSpec = namedtuple('ArgSpec', 'args varargs keywords defaults')
+            def getargspec(func):
+                spec = inspect.getfullargspec(func)
+                return ArgSpec(spec.args, spec.varargs, spec.varkw, spec.defaults)
+            inspect.getargspec = getargspec
+        # ------------------------------------
+
+        import pymorphy2 as pymorphy
+    return pymorphy
+
+
+def get_morph():
+    global _morph
+    if _morph is None:
+        _morph = _import_pymorphy().MorphAnalyzer()
+    return _morph
+
+
+# Cписок стоп-слов
+HTML_STOP_WORDS = {
+    'style', 'div', 'width', 'height', 'br', 'span', 'class', 'id', 'href', 'src',
+    'px', 'pt', 'em', 'rem', 'color', 'background', 'font', 'size', 'border',
+    'margin', 'padding', 'align', 'valign', 'center', 'left', 'right', 'justify',
+    'table', 'tr', 'td', 'th', 'tbody', 'thead', 'colspan', 'rowspan', 'target',
+    'rel', 'nofollow', 'blank', 'www', 'com', 'org', 'net', 'ru', 'quot', 'strong',
+    'bold', 'italic', 'underline', 'block', 'inline', 'none', 'hidden', 'visible',
+    'display', 'position', 'float', 'clear', 'overflow', 'zindex', 'opacity',
+    'img', 'alt', 'title', 'css', 'html', 'body', 'head', 'meta', 'link',
+    'ffffff', 'cellspacing', 'cellpadding', 'helvetica', 'arial', 'verdana',
+    'usedesk', 'normal', 'variant', 'rgb', 'rgba', 'sans', 'serif', 'blockquote',
+    'white', 'space', 'pre', 'wrap', 'text', 'family', 'line', 'height',
+    'amp', 'comment_id', 'answer', 'email', 'mailto', 'http', 'https',
+    'yandex', 'practicum', 'mail', 'support', 'usedesk', 'ticket', 'weight', 'start transform',
+    '255', '000', '111', '222', '333', '444', '555', '666', '777', '888', '999',
+}
+
+COMMON_RUSSIAN_STOP_WORDS = {
+    'добрый', 'здравствуйте', 'день', 'здравствуй', 'привет', 'спасибо', 'пожалуйста',
+    'уважаемый', 'можно', 'нужно', 'хочу', 'могу', 'есть', 'нет', 'да', 'не', 'на', 
+    'в', 'и', 'с', 'у', 'о', 'по', 'за', 'от', 'из', 'к', 'до', 'для', 'или', 'но',
+    'что', 'как', 'это', 'так', 'вот', 'же', 'ли', 'бы', 'то', 'во', 'со', 'изо',
+    'меня', 'тебя', 'его', 'её', 'нас', 'вас', 'их', 'мой', 'твой', 'свой', 'наш',
+    'ваш', 'ихний', 'кто', 'чего', 'чем', 'кому', 'чему', 'кого', 'ещё', 'уже',
+    'очень', 'более', 'самый', 'такой', 'весь', 'который', 'какой', 'тут', 'тот',
+    'будет', 'было', 'были', 'буду', 'будем', 'будете', 'будут',
+}
+
+DOMAIN_STOP_WORDS = {
+    # Техническое
+    'usedesk', 'ticket', 'comment', 'answer', 'email', 'support', 'mail', 'mailto',
+    'yandex', 'practicum', 'практикум', 'яндекс', 'практикума',
+    
+    # Email
+    'sent', 'iphone', 'ipad', 'android', 'отправлено', 'from', 'gmail',
+    'почта', 'почту', 'письмо', 'письма',
+    
+    # Даты
+    'января', 'февраля', 'марта', 'апреля', 'мая', 'июня',
+    'июля', 'августа', 'сентября', 'октября', 'ноября', 'декабря',
+    'понедельник', 'вторник', 'среда', 'четверг', 'пятница', 'суббота', 'воскресенье',
+    'сегодня', 'вчера', 'завтра',
+    
+    # HTML/CSS (расширенный список!)
+    'content', 'noreferrer', 'noopener', 'secure', 'nps', 'important', 'nbsp',
+    'bgcolor', 'radius', 'display', 'block', 'inline', 'hidden', 'visible',
+    'opacity', 'overflow', 'target', 'blank', 'rel', 'href', 'src', 'alt',
+    'title', 'class', 'style', 'font', 'margin', 'padding', 'border',
+    'width', 'height', 'px', 'caps', 'start', 'word', 'decoration', 'break', 'transparent', 'inbound', 'blank',
+    'transform', 'lesson', 'max', 'min', 'px',
+    
+    # UTM и аналитика
+    'utm_source', 'utm_medium', 'utm_campaign', 'utm_content', 'utm_term',
+    
+    # Общие фразы
+    'мне', 'меня', 'вам', 'вас', 'нас', 'тебя', 'его', 'её',
+    'можно', 'нужно', 'хочу', 'могу', 'хотел', 'хотела', 'надо',
+    'сейчас', 'теперь', 'уже', 'ещё', 'вопрос', 'помочь', 'помогите',
+    'доброе', 'утро', 'вечер', 'ночь',  # "доброе утро • утро • доброе"
+
+    # Числа и коды
+    '2025', '2024', '00', '07', '06', '01', '02', '03', '04', '05', '08', '09', '10', '11', '12',
+    '540px', '15', '20', '30',
+
+    # Служебные
+    'message', 'сумму', 'чек',  # "message • 00 сумму"
+}
+
+STOP_WORDS = frozenset(COMMON_RUSSIAN_STOP_WORDS | HTML_STOP_WORDS | DOMAIN_STOP_WORDS)
+
+# Шаблоны очистки компилируются один раз при импорте; близкие шаблоны
+# объединены в альтернации, чтобы текст проходился меньшее число раз
+EMAIL_SIGNATURE_PATTERN = re.compile(
+    r'Отправлено с (?:iPhone|iPad|Android|мобильн\w+)'
+    r'|Sent from (?:my )?iPhone'
+    r'|--\s*Отправлено из.*?Почты'
+    r'|Служба образовательной поддержки.*'
+    r'|T_I_C_K_E_T_I_D_\d+'
+    r'|U_D_I_D_\d+'
+    r'|Оцените.*нашу поддержку:.*'
+    r'|Это письмо содержит ответы на опрос.*'
+    r'|Яндекс не несёт ответственности.*',
+    re.IGNORECASE | re.DOTALL
+)
+HTML_TAG_PATTERN = re.compile(r'<[^>]+>')
+HTML_ENTITY_PATTERN = re.compile(r'&(?:[a-z]+|#\d+);')
+# CSS-свойства и HTML-атрибуты — отдельными проходами: общая альтернация
+# не эквивалентна (свойство внутри значения атрибута, "title='Q: x'",
+# и атрибут после двоеточия, "url=https://... \"Записаться\"")
+CSS_PROPERTY_PATTERN = re.compile(r'[a-z\-]+\s*:\s*[^;"]+;?', re.IGNORECASE)
+HTML_ATTRIBUTE_PATTERN = re.compile(r'\w+\s*=\s*["\'][^"\']*["\']')
+CSS_UNIT_PATTERN = re.compile(r'\b\d+[a-z%]+\b', re.IGNORECASE)
+CSS_COLOR_PATTERN = re.compile(r'#[0-9a-f]{3,6}\b', re.IGNORECASE)
+HTML_JUNK_WORDS_PATTERN = re.compile(
+    r'\b(?:content|noreferrer|noopener|secure|nps|important|nbsp|bgcolor'
+    r'|radius|display|block|inline|hidden|visible|opacity|overflow'
+    r'|target|blank|rel|href|src|alt|title|class|id)\b',
+    re.IGNORECASE
+)
+REPEATED_NUMBER_PATTERN = re.compile(r'\b(\d+)\s+\1\b')
+CSS_LEFTOVER_PATTERN = re.compile(r'\b(?:\d+px|caps|start)\b', re.IGNORECASE)
+UNDERSCORES_PATTERN = re.compile(r'_+')
+TECH_DATA_PATTERN = re.compile(r'Технические данные:.*', re.IGNORECASE)
+
+
+def strip_html_tags(text: str) -> str:
+    """
+    HTML_TAG_PATTERN.sub(' ', text) с линейным худшим случаем: после последнего
+    '>' тег закончиться не может, а без обрезки каждый '<' там (например, "<3"
+    или "<<<<" в тексте обращения) заново просматривает строку до конца
+    """
+    end = text.rfind('>') + 1
+    if not end:
+        return text
+    return HTML_TAG_PATTERN.sub(' ', text[:end]) + text[end:]
+
+
+def clean_html(text: str) -> str:
+    """Агрессивная очистка HTML и CSS"""
+    if not isinstance(text, str):
+        return ""
+    
+    # Шаблоны с обязательным символом ('<', '&', ':', '=', '#', '_') запускаем,
+    # только если он есть в тексте: проверка `in` быстрее прохода регулярки,
+    # а обычные текстовые обращения без разметки так пропускают большую часть шагов.
+    # Замены вставляют только пробелы, поэтому новых таких символов не появляется
+
+    # 1. Удаляем email-подписи и шаблоны
+    text = EMAIL_SIGNATURE_PATTERN.sub(' ', text)
+    
+    # 2. HTML-теги и entities
+    if '<' in text:
+        text = strip_html_tags(text)
+    if '&' in text:
+        text = HTML_ENTITY_PATTERN.sub(' ', text)
+    
+    # 3. CSS-стили (усиленная версия)
+    if ':' in text:
+        text = CSS_PROPERTY_PATTERN.sub(' ', text)
+    if '=' in text:
+        text = HTML_ATTRIBUTE_PATTERN.sub(' ', text)
+    text = CSS_UNIT_PATTERN.sub(' ', text)
+    if '#' in text:
+        text = CSS_COLOR_PATTERN.sub(' ', text)
+    
+    # 4. Удаляем HTML/CSS слова-мусор
+    text = HTML_JUNK_WORDS_PATTERN.sub(' ', text)
+    
+    # 5. Удаляем повторяющиеся числа и CSS-слова
+    text = REPEATED_NUMBER_PATTERN.sub('', text)
+    text = CSS_LEFTOVER_PATTERN.sub('', text)
+    
+    # 6. Удаляем подчёркивания (из форм)
+    if '_' in text:
+        text = UNDERSCORES_PATTERN.sub(' ', text)
+    
+    # 7. Удаляем "Технические данные:"
+    if ':' in text:
+        text = TECH_DATA_PATTERN.sub('', text)
+
+    # 8. Чистим пробелы
+    text = ' '.join(text.split())
+    
+    return text
+
+
+URL_PATTERN = re.compile(r'http\S+')
+NON_WORD_PATTERN = re.compile(r'[^\w\s]')
+
+LATIN_LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+CYRILLIC_LETTERS = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+JUNK_SUBSTRINGS = ('amp', 'comment', 'answer', 'mailto')
+
+
+def is_code_token(word: str) -> bool:
+    """Число с буквенным суффиксом или префиксом ("10px", "h1") — размеры, коды, id"""
+    head = word.rstrip(LATIN_LETTERS)
+    if head != word and head.isdecimal():
+        return True
+    tail = word.lstrip(LATIN_LETTERS)
+    return tail != word and tail.isdecimal()
+
+
+def lemmatize(word: str) -> str:
+    """Нормальная форма слова"""
+    return get_morph().parse(word)[0].normal_form
+
+
+@lru_cache(maxsize=262_144)
+def normalize_token(w: str) -> str:
+    """
+    Лемма токена или "" если токен отбрасывается. Словоформ в корпусе мало
+    (распределение ципфово), поэтому фильтры и морфологический разбор считаются
+    один раз на словоформу; в каждом процессе-воркере свой кэш
+    """
+    # Расширенная фильтрация: проверки формы слова — через str.strip
+    # по наборам символов, без регулярок на каждый токен
+    if not (len(w) > 2 and
+            len(w) < 20 and
+            w not in STOP_WORDS and
+            not w.isdigit() and
+            not is_code_token(w) and
+            not any(bad in w for bad in JUNK_SUBSTRINGS)):
+        return ""
+    # Лемматизация только русских слов
+    if not w.strip(CYRILLIC_LETTERS):
+        return lemmatize(w)
+    return w
+
+
+def preprocess_text(text: str) -> str:
+    """Улучшенная предобработка"""
+    if not isinstance(text, str) or not text.strip():
+        return ""
+    
+    text = clean_html(text)
+    text = text.lower()
+    text = URL_PATTERN.sub('', text)
+    text = NON_WORD_PATTERN.sub(' ', text)
+    
+    return ' '.join(filter(None, map(normalize_token, text.split())))
+
+
+# Меньше этого числа текстов запуск процессов-воркеров дороже самой обработки
+PARALLEL_MIN_TEXTS = 2000
+PARALLEL_BATCH_SIZE = 256
+
+
+def preprocess_texts(texts: List[str]) -> List[str]:
+    """
+    preprocess_text для списка текстов; большие списки — параллельно на всех ядрах.
+    У каждого воркера свой MorphAnalyzer и кэш лемм. Без joblib — последовательно.
+    """
+    if len(texts) < PARALLEL_MIN_TEXTS:
+        return [preprocess_text(t) for t in texts]
+    try:
+        from joblib import Parallel, delayed
+    except ImportError:
+        return [preprocess_text(t) for t in texts]
+    return Parallel(n_jobs=-1, backend='loky', batch_size=PARALLEL_BATCH_SIZE)(
+        delayed(preprocess_text)(t) for t in texts
+    )
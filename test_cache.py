@@ -1,6 +1,12 @@
 # test_cache.py (опционально)
+import os
+import time
+
 import pandas as pd
-from cache_manager import cache
+import pytest
+
+import cache_manager
+from cache_manager import ClusteringCache, cache
 
 def test_cache():
     # Сохранение
@@ -18,7 +24,99 @@ def test_cache():
     loaded = cache.load(key)
     assert loaded is not None
     assert loaded['stats']['n_clusters'] == 1
+    assert loaded['df']['text'].tolist() == ['test']
     print("✅ Loaded successfully")
 
+
+@pytest.fixture
+def tmp_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_manager, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(cache_manager, "CATEGORY_CACHE_DIR", tmp_path / "categories")
+    monkeypatch.setattr(cache_manager, "MAX_CACHE_ITEMS", 3)
+    monkeypatch.setattr(cache_manager, "MAX_CACHE_AGE_SECONDS", 3600)
+    return ClusteringCache()
+
+
+def _entry(cache_dir, name, age):
+    """Файл кэша (.pkl + .feather) с mtime в прошлом на age секунд"""
+    mtime = time.time() - age
+    for suffix in (".pkl", ".feather"):
+        path = cache_dir / f"{name}{suffix}"
+        path.write_bytes(b"")
+        os.utime(path, (mtime, mtime))
+
+
+def test_cleanup_removes_expired_entries(tmp_cache):
+    _entry(tmp_cache.cache_dir, "fresh", age=10)
+    _entry(tmp_cache.cache_dir, "expired", age=7200)
+
+    tmp_cache._cleanup_old_cache()
+
+    assert sorted(p.name for p in tmp_cache.cache_dir.iterdir()) == [
+        "fresh.feather", "fresh.pkl"
+    ]
+
+
+def test_cleanup_keeps_newest_within_limit(tmp_cache):
+    for i, age in enumerate([50, 10, 40, 20, 30]):
+        _entry(tmp_cache.cache_dir, f"item{i}", age=age)
+
+    tmp_cache._cleanup_old_cache()
+
+    assert sorted(p.stem for p in tmp_cache.cache_dir.glob("*.pkl")) == [
+        "item1", "item3", "item4"
+    ]
+    assert sorted(p.stem for p in tmp_cache.cache_dir.glob("*.feather")) == [
+        "item1", "item3", "item4"
+    ]
+
+
+def test_cleanup_ignores_other_files(tmp_cache):
+    (tmp_cache.cache_dir / "notes.txt").write_text("x")
+    _entry(tmp_cache.cache_dir, "fresh", age=10)
+
+    tmp_cache._cleanup_old_cache()
+
+    assert (tmp_cache.cache_dir / "notes.txt").exists()
+    assert (tmp_cache.cache_dir / "fresh.pkl").exists()
+
+
+
+def test_cleanup_removes_expired_category_cache(tmp_cache):
+    categories_dir = cache_manager.CATEGORY_CACHE_DIR
+    categories_dir.mkdir()
+    for name, age in [("fresh.json", 10), ("expired.json", 7200)]:
+        path = categories_dir / name
+        path.write_bytes(b"[]")
+        os.utime(path, (time.time() - age, time.time() - age))
+
+    tmp_cache._cleanup_old_cache()
+
+    assert [p.name for p in categories_dir.iterdir()] == ["fresh.json"]
+
+
+def test_cleanup_runs_every_n_writes(tmp_cache, monkeypatch):
+    calls = []
+    monkeypatch.setattr(tmp_cache, "_cleanup_old_cache", lambda: calls.append(1))
+    tmp_cache._last_cleanup = time.time()
+    data = {'df': None, 'stats': {}}
+
+    for _ in range(ClusteringCache.CLEANUP_EVERY_N_WRITES - 1):
+        tmp_cache.save(user_id=1, file_name='a.csv', data=dict(data))
+    assert calls == []
+
+    tmp_cache.save(user_id=1, file_name='a.csv', data=dict(data))
+    assert calls == [1]
+
+
+def test_cleanup_runs_after_interval(tmp_cache, monkeypatch):
+    calls = []
+    monkeypatch.setattr(tmp_cache, "_cleanup_old_cache", lambda: calls.append(1))
+    tmp_cache._last_cleanup = time.time() - ClusteringCache.CLEANUP_INTERVAL_SECONDS - 1
+
+    tmp_cache.save(user_id=1, file_name='a.csv', data={'df': None})
+    assert calls == [1]
+
+
 if __name__ == '__main__':
     test_cache()
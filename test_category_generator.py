@@ -0,0 +1,64 @@
+import orjson
+import pytest
+
+from category_generator import CategoryGenerator, CategorySuggestion, extract_code_block
+
+
+def _split_fences(text: str) -> str:
+    """Исходная логика: разбиение по ```json / ```"""
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0]
+    elif "```" in text:
+        text = text.split("```")[1].split("```")[0]
+    return text.strip()
+
+
+@pytest.mark.parametrize("response", [
+    '{"categories": []}',
+    '```json\n{"categories": [{"name": "A"}]}\n```',
+    '```\n{"categories": []}\n```',
+    '```json\n[{"name": "A"}, {"name": "B"}]\n```',
+    'Вот категории:\n```json\n  \n{"categories": []}\n```\nГотово',
+    '```json\nКатегории: {"categories": []}\n```',
+    '```json\n{"categories": []}',
+    '```json``` хвост',
+    '',
+])
+def test_extract_code_block_matches_split(response):
+    assert extract_code_block(response) == _split_fences(response)
+
+
+def test_extract_code_block_keeps_array():
+    response = '```json\n[{"name": "A"}]\n```'
+    assert orjson.loads(extract_code_block(response)) == [{"name": "A"}]
+
+
+@pytest.fixture
+def generator(tmp_path):
+    gen = CategoryGenerator(api_key="test-key", folder_id="test-folder")
+    gen.cache_dir = tmp_path
+    return gen
+
+
+def test_get_sample_is_stable_for_same_file(generator):
+    texts = [f"обращение {i}" for i in range(3000)]
+    first = generator.get_sample(texts)
+    assert len(first) == 500
+    assert generator.get_sample(list(texts)) == first
+    assert generator.get_sample(texts[:-1] + ["другое"]) != first
+
+
+def test_cache_key_ignores_sample_order(generator):
+    sample = ["оплата не прошла", "не открывается урок", "перенос дедлайна"]
+    template = CategoryGenerator.DEFAULT_PROMPT
+    path = generator._cache_path(template, sample)
+    assert generator._cache_path(template, sample[::-1]) == path
+    assert generator._cache_path(template, sample[:2]) != path
+    assert generator._cache_path("{texts}", sample) != path
+
+
+def test_cache_round_trip(generator):
+    path = generator._cache_path("{texts}", ["a"])
+    categories = [CategorySuggestion(name="Оплата", description="", examples=["x"])]
+    generator._save_cached(path, categories)
+    assert generator._load_cached(path) == categories
@@ -0,0 +1,301 @@
+# test_classification.py
+import re
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import msgspec
+
+import classification
+from classification import (
+    RESULT_DECODER, UNDEFINED_CATEGORY, LLMClassifier, ResponseCache, SemanticCache,
+    category_column, confidence_as_float64, decode_tolerant, find_json_object,
+    parse_categories_from_text, repair_json, strip_leading_number
+)
+
+
+def unit_pair(similarity: float, dim: int = 8):
+    """Два нормированных вектора с заданным косинусным сходством"""
+    a = np.zeros(dim, dtype=np.float32)
+    a[0] = 1.0
+    b = np.zeros(dim, dtype=np.float32)
+    b[0] = similarity
+    b[1] = np.sqrt(1.0 - similarity ** 2)
+    return a, b
+
+
+@pytest.fixture
+def classifier_env(monkeypatch):
+    monkeypatch.setenv("YANDEX_API_KEY", "test-key")
+    monkeypatch.setenv("YANDEX_FOLDER_ID", "test-folder")
+
+
+def test_semantic_cache_threshold():
+    cache = SemanticCache(threshold=0.92)
+    stored, _ = unit_pair(0.0)
+    cache.add(stored, {"category": "Оплата", "confidence": 0.9, "reasoning": ""})
+
+    _, near = unit_pair(0.925)
+    _, far = unit_pair(0.915)
+    assert cache.lookup(near)["category"] == "Оплата"
+    assert cache.lookup(far) is None
+    assert cache.lookup(stored)["category"] == "Оплата"
+
+
+def test_semantic_cache_empty_and_growth():
+    cache = SemanticCache(threshold=0.92, max_entries=300)
+    assert cache.lookup(np.ones(4, dtype=np.float32) / 2) is None
+
+    # Больше начальной ёмкости (256) — матрица растёт, старые записи на месте
+    for i in range(300):
+        v = np.zeros(300, dtype=np.float32)
+        v[i] = 1.0
+        cache.add(v, {"category": str(i)})
+    assert len(cache) == 300
+    probe = np.zeros(300, dtype=np.float32)
+    probe[7] = 1.0
+    assert cache.lookup(probe)["category"] == "7"
+
+    cache.add(probe, {"category": "overflow"})
+    assert len(cache) == 300
+
+
+def test_semantic_cache_save_load(tmp_path):
+    cache = SemanticCache(threshold=0.92)
+    stored, near = unit_pair(0.95)
+    cache.add(stored, {"category": "Доставка"})
+    cache.save(tmp_path / "index")
+    assert not cache.dirty
+
+    loaded = SemanticCache(threshold=0.92)
+    assert loaded.load(tmp_path / "index")
+    assert loaded.lookup(near)["category"] == "Доставка"
+    assert not SemanticCache().load(tmp_path / "missing")
+
+
+def test_semantic_cache_disabled_by_default(classifier_env, monkeypatch):
+    def fail():
+        raise AssertionError("модель эмбеддингов не должна загружаться")
+
+    monkeypatch.setattr(classification, "get_embedding_model", fail)
+    classifier = LLMClassifier(response_cache_path=None, semantic_cache_dir=None)
+    assert classifier.semantic_cache_enabled is False
+    assert classifier._encode_texts(["текст"]) is None
+
+
+def test_classifier_semantic_hits_and_misses(classifier_env):
+    classifier = LLMClassifier(
+        semantic_cache_enabled=True,
+        semantic_threshold=0.92,
+        response_cache_path=None,
+        semantic_cache_dir=None,
+    )
+    categories = ["Оплата", "Доставка"]
+    stored, near = unit_pair(0.93)
+    _, far = unit_pair(0.91)
+
+    cached, key, semantic_cache = classifier._lookup_caches(
+        "не прошла оплата", categories, embedding=stored
+    )
+    assert cached is None
+    classifier._build_result(
+        "не прошла оплата", categories, ("Оплата", 0.9, ""),
+        key, semantic_cache, stored
+    )
+
+    hit, _, _ = classifier._lookup_caches("оплата не прошла", categories, embedding=near)
+    assert hit["category"] == "Оплата"
+    assert classifier.semantic_hits == 1
+
+    miss, _, _ = classifier._lookup_caches("где мой заказ", categories, embedding=far)
+    assert miss is None
+
+    # Индекс свой для каждого набора категорий
+    other, _, _ = classifier._lookup_caches(
+        "оплата не прошла", ["Оплата", "Возврат"], embedding=near
+    )
+    assert other is None
+
+
+def test_response_cache_batches_writes(tmp_path):
+    path = tmp_path / "responses.sqlite"
+    cache = ResponseCache(path, ttl=3600)
+    cache.set("a", b'{"category": "X"}')
+    # До flush запись видна из памяти, но ещё не на диске
+    assert cache.get("a") == b'{"category": "X"}'
+    assert ResponseCache(path, ttl=3600).get("a") is None
+
+    cache.flush()
+    assert ResponseCache(path, ttl=3600).get("a") == b'{"category": "X"}'
+    assert cache.get("missing") is None
+
+
+def test_response_cache_signals_flush(tmp_path):
+    cache = ResponseCache(tmp_path / "responses.sqlite", ttl=3600)
+    signals = [cache.set(f"k{i}", b"r") for i in range(ResponseCache.FLUSH_EVERY)]
+    assert signals[-1] is True
+    assert not any(signals[:-1])
+    cache.flush()
+    assert cache.set("next", b"r") is False
+
+
+def test_response_cache_ttl(tmp_path, monkeypatch):
+    path = tmp_path / "responses.sqlite"
+    cache = ResponseCache(path, ttl=10)
+    cache.set("old", b"r")
+    cache.flush()
+
+    later = time.time() + 60
+    monkeypatch.setattr(time, "time", lambda: later)
+    assert cache.get("old") is None
+    # Просроченные записи удаляются при открытии
+    reopened = ResponseCache(path, ttl=10)
+    count = reopened._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+    assert count == 0
+
+
+def test_response_cache_key_depends_on_generation_params():
+    key = ResponseCache.make_key("gpt://f/m", 0.1, 80, "prompt")
+    assert key == ResponseCache.make_key("gpt://f/m", 0.1, 80, "prompt")
+    assert key != ResponseCache.make_key("gpt://f/m", 0.2, 80, "prompt")
+    assert key != ResponseCache.make_key("gpt://f/m", 0.1, 500, "prompt")
+    assert key != ResponseCache.make_key("gpt://f/m", 0.1, 80, "prompt!")
+
+
+def test_confidence_float32_round_trip(classifier_env):
+    compact = pd.Series([0.9, 0.85, 0.7], dtype='float32')
+    assert confidence_as_float64(compact).tolist() == [0.9, 0.85, 0.7]
+
+    df = pd.DataFrame({"category": ["A", "A", "B"], "confidence": compact})
+    stats = LLMClassifier(response_cache_path=None, semantic_cache_dir=None).get_classification_stats(df)
+    assert stats["min_confidence"] == 0.7
+    assert stats["max_confidence"] == 0.9
+    assert stats["avg_confidence"] == pytest.approx(0.816667, abs=1e-6)
+
+
+def test_category_column_vocabulary_order():
+    values = pd.Series(["Возврат", "Неизвестная", UNDEFINED_CATEGORY, "Оплата", "Другая", "Неизвестная"])
+    column = category_column(values, ["Оплата", "Доставка", "Возврат"])
+    # Категории пользователя в его порядке, затем "не определено", затем
+    # неизвестные ответы модели в порядке появления
+    assert list(column.categories) == [
+        "Оплата", "Доставка", "Возврат", UNDEFINED_CATEGORY, "Неизвестная", "Другая"
+    ]
+    assert list(column) == list(values)
+
+    # "Не определено" в списке пользователя не дублируется
+    column = category_column(pd.Series(["Оплата"]), ["Оплата", UNDEFINED_CATEGORY])
+    assert list(column.categories) == ["Оплата", UNDEFINED_CATEGORY]
+
+
+def test_classification_stats_counts_observed_categories(classifier_env):
+    categories = ["Оплата", "Доставка", "Возврат"]
+    df = pd.DataFrame({
+        "category": category_column(
+            pd.Series(["Оплата", UNDEFINED_CATEGORY, "Оплата", "Возврат"]), categories
+        ),
+        "confidence": pd.Series([0.9, 1.0, 0.8, 0.7], dtype="float32"),
+    })
+    stats = LLMClassifier(response_cache_path=None, semantic_cache_dir=None).get_classification_stats(df)
+
+    # observed=True: категории без текстов ("Доставка") в статистику не попадают
+    assert set(stats["categories"]) == {"Оплата", "Возврат", UNDEFINED_CATEGORY}
+    assert stats["categories"]["Оплата"]["count"] == 2
+    assert stats["categories"]["Оплата"]["avg_confidence"] == pytest.approx(0.85, abs=1e-9)
+    assert stats["categories"]["Возврат"]["avg_confidence"] == 0.7
+    assert stats["undefined_count"] == 1
+    assert stats["undefined_percentage"] == 25.0
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("1. Доставка", "Доставка"),
+    ("12.Оплата", "Оплата"),
+    ("3.   \tВозврат", "Возврат"),
+    ("12) Оплата", "12) Оплата"),
+    ("Доставка", "Доставка"),
+    ("1.5 Доставка", "5 Доставка"),
+    ("1.", ""),
+    ("1", "1"),
+    (".5 Доставка", ".5 Доставка"),
+    ("2024", "2024"),
+    ("", ""),
+    ("². Степень", "². Степень"),
+    ("٣. Арабская цифра", "Арабская цифра"),
+])
+def test_strip_leading_number_matches_regex(raw, expected):
+    assert strip_leading_number(raw) == expected
+    assert strip_leading_number(raw) == re.sub(r'^\d+\.\s*', '', raw)
+
+
+@pytest.mark.parametrize("text, allow_array, expected", [
+    ('{"category": "A"}', False, '{"category": "A"}'),
+    ('Ответ: {"category": "Доставка", "confidence": 0.9} Готово', False,
+     '{"category": "Доставка", "confidence": 0.9}'),
+    ('{"a": {"b": [1, {"c": 2}]}} {"d": 3}', False, '{"a": {"b": [1, {"c": 2}]}}'),
+    ('{"reasoning": "} и { внутри строки"}', False, '{"reasoning": "} и { внутри строки"}'),
+    (r'{"reasoning": "кавычка \" и }"} хвост', False, r'{"reasoning": "кавычка \" и }"}'),
+    (r'{"reasoning": "слэш \\"} хвост', False, r'{"reasoning": "слэш \\"}'),
+    ('[{"id": 1}] {"x": 1}', False, '{"id": 1}'),
+    ('[{"id": 1}] {"x": 1}', True, '[{"id": 1}]'),
+    ('{"results": [{"id": 1}]}', True, '{"results": [{"id": 1}]}'),
+])
+def test_find_json_object(text, allow_array, expected):
+    data = text.encode()
+    start, end = find_json_object(data, allow_array=allow_array)
+    assert data[start:end] == expected.encode()
+
+
+@pytest.mark.parametrize("data", [b"", b"no json here", b'{"category": "A"', b'{"a": "}'])
+def test_find_json_object_not_found(data):
+    assert find_json_object(data) == (-1, -1)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"category": "A", "confidence": 0.9,}', {"category": "A", "confidence": 0.9}),
+    ('{"results": [{"id": 1}, {"id": 2},\n]}', {"results": [{"id": 1}, {"id": 2}]}),
+    ("{'category': 'Доставка'}", {"category": "Доставка"}),
+    ("{'reasoning': 'он сказал \"нет\"'}", {"reasoning": 'он сказал "нет"'}),
+    (r"{'reasoning': 'it\'s ok'}", {"reasoning": "it's ok"}),
+    ('{"reasoning": "строка 1\nстрока 2\tконец"}', {"reasoning": "строка 1\nстрока 2\tконец"}),
+    ('{"reasoning": "запятая, внутри, строки,"}', {"reasoning": "запятая, внутри, строки,"}),
+    (r'{"reasoning": "уже \"экранировано\""}', {"reasoning": 'уже "экранировано"'}),
+])
+def test_repair_json(text, expected):
+    assert msgspec.json.decode(repair_json(text.encode())) == expected
+
+
+def test_repair_json_keeps_valid_json():
+    data = '{"category": "Оплата", "confidence": 0.8, "reasoning": "a, b"}'.encode()
+    assert msgspec.json.decode(repair_json(data)) == msgspec.json.decode(data)
+
+
+def test_decode_tolerant_repairs_syntax_errors():
+    result = decode_tolerant(RESULT_DECODER, b"{'category': 'A', 'confidence': '0.7',}")
+    assert result.category == "A"
+    assert result.confidence == 0.7
+
+
+def test_decode_tolerant_does_not_retry_validation_errors(monkeypatch):
+    calls = []
+    monkeypatch.setattr(classification, "repair_json", lambda data: calls.append(data) or data)
+    with pytest.raises(msgspec.ValidationError):
+        decode_tolerant(RESULT_DECODER, b'{"category": "A", "confidence": "high"}')
+    assert calls == []
+
+
+def test_decode_tolerant_raises_when_repair_fails():
+    with pytest.raises(msgspec.DecodeError):
+        decode_tolerant(RESULT_DECODER, b'{"category": ')
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("a,\nb; c", ["a", "b", "c"]),
+    ("a, b; c", ["a, b", "c"]),
+    ("Оплата, сроки\nДоставка", ["Оплата, сроки", "Доставка"]),
+    ("Оплата, Доставка, Качество", ["Оплата", "Доставка", "Качество"]),
+    ("1. Оплата\n2) Доставка,\n", ["Оплата", "Доставка"]),
+])
+def test_parse_categories_from_text(text, expected):
+    assert parse_categories_from_text(text) == expected
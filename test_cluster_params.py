@@ -0,0 +1,79 @@
+import dataclasses
+
+import pytest
+
+from cluster_params import (
+    BASE_PARAMS, BASE_PARAMS_UPPER_BOUNDS, N_CLUSTERS_UPPER_BOUNDS,
+    ClusteringParams, estimate_n_clusters, get_clustering_params
+)
+
+
+def _reference_base(n_texts: int):
+    """Исходная цепочка if/elif: (min_cluster_size, min_samples, n_neighbors, n_components)"""
+    if n_texts < 50:
+        return 3, 1, 5, 5
+    elif n_texts < 100:
+        return 4, 2, 8, 7
+    elif n_texts < 250:
+        return 5, 2, 10, 8
+    elif n_texts < 500:
+        return 7, 3, 15, 10
+    elif n_texts < 1000:
+        return 10, 3, 20, 10
+    elif n_texts < 2500:
+        return 15, 4, 25, 10
+    elif n_texts < 5000:
+        return 20, 5, 30, 12
+    elif n_texts < 10000:
+        return 30, 7, 40, 12
+    elif n_texts < 30000:
+        return 45, 10, 55, 12
+    return 60, 15, 70, 15
+
+
+def _reference_n_clusters(n_texts: int):
+    if n_texts < 100:
+        return (2, 8)
+    elif n_texts < 500:
+        return (5, 20)
+    elif n_texts < 2000:
+        return (10, 50)
+    elif n_texts < 10000:
+        return (20, 100)
+    return (30, 200)
+
+
+def _around(bounds):
+    return sorted({0, 1, 10 ** 6} | {b + d for b in bounds for d in (-1, 0, 1)})
+
+
+@pytest.mark.parametrize("n_texts", _around(BASE_PARAMS_UPPER_BOUNDS))
+@pytest.mark.parametrize("embedding_dim", [312, 384, 768])
+def test_clustering_params_match_reference(n_texts, embedding_dim):
+    params = get_clustering_params(n_texts, embedding_dim)
+
+    min_size, min_samples, n_neighbors, n_components = _reference_base(n_texts)
+    size_multiplier = max(0.6, min(1.2, embedding_dim / 384.0))
+    component_multiplier = max(0.8, min(1.5, embedding_dim / 384.0))
+    assert params.min_cluster_size == max(3, int(min_size * size_multiplier))
+    assert params.min_samples == min_samples
+    assert params.n_neighbors == n_neighbors
+    assert params.n_components == max(5, int(n_components * component_multiplier))
+    assert params.description.endswith(f"| embedding_dim={embedding_dim}")
+
+
+@pytest.mark.parametrize("n_texts, row", [(0, 0), (49, 0), (50, 1), (29999, 8), (30000, 9)])
+def test_clustering_params_boundaries(n_texts, row):
+    assert get_clustering_params(n_texts).description.startswith(BASE_PARAMS[row].description)
+
+
+@pytest.mark.parametrize("n_texts", _around(N_CLUSTERS_UPPER_BOUNDS))
+def test_estimate_n_clusters_matches_reference(n_texts):
+    assert estimate_n_clusters(n_texts) == _reference_n_clusters(n_texts)
+
+
+def test_base_params_shared_and_frozen():
+    assert len(BASE_PARAMS) == len(BASE_PARAMS_UPPER_BOUNDS) + 1
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        BASE_PARAMS[0].min_cluster_size = 100
+    assert isinstance(get_clustering_params(10), ClusteringParams)
@@ -0,0 +1,141 @@
+import re
+
+import pytest
+
+import preprocessing
+from preprocessing import HTML_TAG_PATTERN, clean_html, normalize_token, strip_html_tags
+
+
+def _reference_clean_html(text: str) -> str:
+    """Исходная clean_html: каждый шаблон отдельным re.sub"""
+    if not isinstance(text, str):
+        return ""
+    email_patterns = [
+        r'Отправлено с (iPhone|iPad|Android|мобильн\w+)',
+        r'Sent from (my )?iPhone',
+        r'--\s*Отправлено из.*?Почты',
+        r'Служба образовательной поддержки.*',
+        r'T_I_C_K_E_T_I_D_\d+',
+        r'U_D_I_D_\d+',
+        r'Оцените.*нашу поддержку:.*',
+        r'Это письмо содержит ответы на опрос.*',
+        r'Яндекс не несёт ответственности.*',
+    ]
+    for pattern in email_patterns:
+        text = re.sub(pattern, ' ', text, flags=re.IGNORECASE | re.DOTALL)
+    text = re.sub(r'<[^>]+>', ' ', text)
+    text = re.sub(r'&[a-z]+;', ' ', text)
+    text = re.sub(r'&#\d+;', ' ', text)
+    text = re.sub(r'[a-z\-]+\s*:\s*[^;"]+;?', ' ', text, flags=re.IGNORECASE)
+    text = re.sub(r'\w+\s*=\s*["\'][^"\']*["\']', ' ', text)
+    text = re.sub(r'\b\d+[a-z%]+\b', ' ', text, flags=re.IGNORECASE)
+    text = re.sub(r'#[0-9a-f]{3,6}\b', ' ', text, flags=re.IGNORECASE)
+    html_junk = [
+        'content', 'noreferrer', 'noopener', 'secure', 'nps', 'important',
+        'nbsp', 'bgcolor', 'radius', 'display', 'block', 'inline', 'hidden',
+        'visible', 'opacity', 'overflow', 'target', 'blank', 'rel', 'href',
+        'src', 'alt', 'title', 'class', 'id',
+    ]
+    for word in html_junk:
+        text = re.sub(rf'\b{word}\b', ' ', text, flags=re.IGNORECASE)
+    text = re.sub(r'\b(\d+)\s+\1\b', '', text)
+    text = re.sub(r'\b\d+px\b', '', text, flags=re.I)
+    text = re.sub(r'\bcaps\b', '', text, flags=re.I)
+    text = re.sub(r'\bstart\b', '', text, flags=re.I)
+    text = re.sub(r'_{3,}', ' ', text)
+    text = re.sub(r'_+', ' ', text)
+    text = re.sub(r'Технические данные:.*', '', text, flags=re.I)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+CSS_EDGE_CASES = [
+    '',
+    'Не могу войти в личный кабинет',
+    'url=https://practicum.yandex.ru/ "Записаться"',
+    "<a title='Q: x'>Вопрос про оплату</a>",
+    "title='Q: x' не открывается урок",
+    'style="color: red; margin:0" текст',
+    '<div style="font-size: 14px;color:#333">Привет</div>',
+    'a=b="c" d: e',
+    'href = "x:y" и ещё: что-то; дальше',
+    '5margin:0 10px 10 10',
+    'class="x" id=\'y\' = "z"',
+    'Время: 10:30, дата=сегодня',
+    'Технические данные: браузер',
+    'поле______ ввод_формы',
+    '&nbsp;&#160;&amp; text: value',
+    '<<<< 3 > 2 : = #fff #12',
+]
+
+
+@pytest.mark.parametrize("text", CSS_EDGE_CASES)
+def test_clean_html_matches_reference(text):
+    assert clean_html(text) == _reference_clean_html(text)
+
+
+def test_clean_html_non_string():
+    assert clean_html(None) == ""
+
+
+@pytest.mark.parametrize("text", [
+    '',
+    'обычный текст',
+    '<b>жирный</b> текст',
+    'люблю курс <3',
+    '<<<< стрелки',
+    'a > b и c < d',
+    '<br/>строка<br>строка<',
+    '<div class="x">текст</div> хвост <3 без тега',
+    '> в начале <i>курсив</i> >> в конце',
+    '<' * 2000 + '>',
+    '<' * 2000 + ' текст',
+])
+def test_strip_html_tags_matches_regex(text):
+    assert strip_html_tags(text) == HTML_TAG_PATTERN.sub(' ', text)
+
+
+@pytest.fixture
+def fake_lemmatize(monkeypatch):
+    """Лемматизация без словарей pymorphy: считает вызовы, лемма — слово без окончания"""
+    calls = []
+
+    def lemmatize(word):
+        calls.append(word)
+        return word[:-1]
+
+    monkeypatch.setattr(preprocessing, "lemmatize", lemmatize)
+    normalize_token.cache_clear()
+    yield calls
+    normalize_token.cache_clear()
+
+
+@pytest.mark.parametrize("token, expected", [
+    ("курсы", "курс"),
+    ("python", "python"),
+    ("ёлки", "ёлк"),
+    ("ок", ""),
+    ("а" * 20, ""),
+    ("спасибо", ""),
+    ("2024", ""),
+    ("10px", ""),
+    ("h1", ""),
+    ("h264x", "h264x"),
+    ("mailto", ""),
+    ("comments", ""),
+])
+def test_normalize_token(fake_lemmatize, token, expected):
+    assert normalize_token(token) == expected
+
+
+def test_normalize_token_lemmatizes_only_cyrillic(fake_lemmatize):
+    normalize_token("курсы")
+    normalize_token("kursy")
+    normalize_token("курсq")
+    assert fake_lemmatize == ["курсы"]
+
+
+def test_normalize_token_caches_per_word_form(fake_lemmatize):
+    for _ in range(3):
+        assert normalize_token("уроки") == "урок"
+    assert fake_lemmatize == ["уроки"]
+    assert normalize_token.cache_info().hits == 2
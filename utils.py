@@ -6,7 +6,9 @@
 import logging
 import time
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from stat import S_ISREG
 from typing import Tuple
 from config import TEMP_DIR
 
@@ -15,6 +17,9 @@ logger = logging.getLogger(__name__)
 # Константа для возраста файлов (24 часа)
 TEMP_FILE_MAX_AGE_HOURS = 24
 
+# Потоков для параллельного удаления временных файлов
+CLEANUP_WORKERS = 16
+
 
 def cleanup_old_temp_files():
     """Удаляет временные файлы старше N часов"""
@@ -25,20 +30,35 @@ def cleanup_old_temp_files():
         
         now = time.time()
         max_age = TEMP_FILE_MAX_AGE_HOURS * 3600
-        removed_count = 0
-        freed_bytes = 0
         
+        # Сначала собираем кандидатов (stat один раз на файл)
+        candidates = []
         for file_path in TEMP_DIR.glob("*"):
-            if file_path.is_file():
-                try:
-                    age = now - file_path.stat().st_mtime
-                    if age > max_age:
-                        size = file_path.stat().st_size
-                        file_path.unlink()
+            try:
+                st = file_path.stat()
+                if S_ISREG(st.st_mode) and now - st.st_mtime > max_age:
+                    candidates.append((file_path, st.st_size))
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to stat {file_path}: {e}")
+        
+        def _unlink(candidate) -> int:
+            file_path, size = candidate
+            try:
+                file_path.unlink(missing_ok=True)
+                return size
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to delete {file_path}: {e}")
+                return -1
+        
+        # Удаляем параллельно: при тысячах файлов не задерживаем старт бота
+        removed_count = 0
+        freed_bytes = 0
+        if candidates:
+            with ThreadPoolExecutor(max_workers=CLEANUP_WORKERS) as executor:
+                for size in executor.map(_unlink, candidates):
+                    if size >= 0:
                         removed_count += 1
                         freed_bytes += size
-                except Exception as e:
-                    logger.warning(f"⚠️ Failed to delete {file_path}: {e}")
         
         if removed_count > 0:
             freed_mb = freed_bytes / (1024 * 1024)